@@ -0,0 +1,154 @@
+import json
+from pathlib import Path
+
+from _text_colors import blue_text, red_text, yellow_text
+from _paths import main_project
+from _ninja_report import object_target
+from _cleaning import compile_output
+from _tracing import traced_run
+
+
+header_suffixes = (".h", ".hh", ".hpp", ".hxx", ".h++", ".inl", ".ipp", ".tpp", ".inc")
+
+
+def request_codemodel(build_dir):
+    # an empty query file makes every configure write the codemodel reply
+    query = build_dir / ".cmake" / "api" / "v1" / "query" / "codemodel-v2"
+    if not query.exists():
+        query.parent.mkdir(parents=True, exist_ok=True)
+        query.touch()
+
+
+def changed_files(git_ref):
+    diff = traced_run(["git", "diff", "--name-only", git_ref], cwd=str(main_project), capture_output=True, text=True)
+    if diff.returncode != 0:
+        print(red_text("git diff against {} failed: ".format(git_ref)) + diff.stderr.strip())
+        return None
+    untracked = traced_run(["git", "ls-files", "--others", "--exclude-standard"], cwd=str(main_project), capture_output=True, text=True)
+    top_level = traced_run(["git", "rev-parse", "--show-toplevel"], cwd=str(main_project), capture_output=True, text=True)
+    root = Path(top_level.stdout.strip() or str(main_project))
+    names = diff.stdout.splitlines() + untracked.stdout.splitlines()
+    return sorted({(root / name).resolve() for name in names if name})
+
+
+def read_codemodel(build_dir, build_type):
+    replies = sorted((build_dir / ".cmake" / "api" / "v1" / "reply").glob("index-*.json"))
+    if not replies:
+        return None
+    reply_dir = replies[-1].parent
+    index = json.loads(replies[-1].read_text())
+    codemodel_file = next((entry["jsonFile"] for entry in index.get("objects", []) if entry.get("kind") == "codemodel"), None)
+    if not codemodel_file:
+        return None
+    codemodel = json.loads((reply_dir / codemodel_file).read_text())
+    source_root = Path(codemodel["paths"]["source"])
+    configurations = codemodel.get("configurations", [])
+    configuration = next((c for c in configurations if c.get("name") == build_type), configurations[0] if configurations else None)
+    if not configuration:
+        return None
+
+    identifiers = {}
+    targets = {}
+    for entry in configuration.get("targets", []):
+        target = json.loads((reply_dir / entry["jsonFile"]).read_text())
+        identifiers[target["id"]] = target["name"]
+        includes = {Path(include["path"]) for group in target.get("compileGroups", []) for include in group.get("includes", [])}
+        sources = {(source_root / source["path"]).resolve() for source in target.get("sources", [])}
+        targets[target["name"]] = {"sources": sources, "includes": includes,
+            "directories": {source.parent for source in sources}, "dependencies": [d["id"] for d in target.get("dependencies", [])]}
+    for target in targets.values():
+        target["dependencies"] = {identifiers[i] for i in target["dependencies"] if i in identifiers}
+    return targets
+
+
+def compile_command_targets(build_dir):
+    # compile_commands.json knows every translation unit, the object path tells its target
+    database = build_dir / "compile_commands.json"
+    owners = {}
+    if not database.exists():
+        return owners
+    for entry in json.loads(database.read_text()):
+        match = object_target.search((compile_output(entry) or "").replace('\\', '/'))
+        if match:
+            owners.setdefault(Path(entry["directory"], entry["file"]).resolve(), set()).add(match.group(1))
+    return owners
+
+
+def with_dependents(affected, dependencies):
+    dependents = {}
+    for name, required in dependencies.items():
+        for dependency in required:
+            dependents.setdefault(dependency, set()).add(name)
+    result = set(affected)
+    pending = list(affected)
+    while pending:
+        for dependent in dependents.get(pending.pop(), ()):
+            if dependent not in result:
+                result.add(dependent)
+                pending.append(dependent)
+    return result
+
+
+def affected_cmake_targets(files, cmake_directory, build_dir, build_type):
+    # None means the impact can not be narrowed down and everything has to be built
+    relevant = [path for path in files if cmake_directory in path.parents]
+    if not relevant:
+        return set()
+    if any(path.name == "CMakeLists.txt" or path.suffix == ".cmake" or path.name.startswith("conanfile") for path in relevant):
+        print(yellow_text("Build scripts changed") + ", every CMake target is affected")
+        return None
+    if not (build_dir / "CMakeCache.txt").exists():
+        return None
+
+    request_codemodel(build_dir)
+    targets = read_codemodel(build_dir, build_type)
+    if targets is None:
+        print("Refreshing the CMake file API reply in " + str(build_dir))
+        traced_run(["cmake", str(build_dir)], cwd=str(cmake_directory), capture_output=True)
+        targets = read_codemodel(build_dir, build_type)
+    if targets is None:
+        print(yellow_text("No CMake codemodel available") + ", every CMake target is affected")
+        return None
+
+    owners = compile_command_targets(build_dir)
+    affected = set()
+    for path in relevant:
+        matched = owners.get(path, set()) | {name for name, target in targets.items() if path in target["sources"]}
+        if not matched and path.suffix.lower() in header_suffixes:
+            # headers are not listed anywhere, so every target that can see them is affected
+            matched = {name for name, target in targets.items()
+                if path.parent in target["directories"] or any(include == path.parent or include in path.parents for include in target["includes"])}
+        affected |= matched
+    return with_dependents(affected, {name: target["dependencies"] for name, target in targets.items()})
+
+
+def affected_cargo_packages(files, rust_directory):
+    relevant = [path for path in files if rust_directory in path.parents]
+    if not relevant:
+        return set()
+    metadata = traced_run(["cargo", "metadata", "--format-version", "1"], cwd=str(rust_directory), capture_output=True, text=True)
+    if metadata.returncode != 0:
+        print(yellow_text("cargo metadata failed") + ", every Rust package is affected")
+        return None
+    metadata = json.loads(metadata.stdout)
+    members = set(metadata["workspace_members"])
+    directories = {package["id"]: Path(package["manifest_path"]).parent.resolve() for package in metadata["packages"] if package["id"] in members}
+    names = {package["id"]: package["name"] for package in metadata["packages"]}
+
+    affected = set()
+    for path in relevant:
+        owners = [(len(directory.parts), package) for package, directory in directories.items() if directory in path.parents]
+        if not owners or path.name in ("Cargo.lock", "Cargo.toml") and path.parent == rust_directory:
+            print(yellow_text("{} is shared by the workspace".format(path.name)) + ", every Rust package is affected")
+            return None
+        affected.add(max(owners)[1])
+
+    dependencies = {node["id"]: {dependency["pkg"] for dependency in node.get("deps", [])}
+        for node in (metadata.get("resolve") or {}).get("nodes", []) if node["id"] in members}
+    return {names[package] for package in with_dependents(affected, dependencies)}
+
+
+def describe(kind, affected):
+    if affected is None:
+        return kind + ": " + blue_text("everything")
+    return kind + ": " + (blue_text(', '.join(sorted(affected))) if affected else "nothing")
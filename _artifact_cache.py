@@ -0,0 +1,163 @@
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from _text_colors import green_text, yellow_text
+from _paths import main_project, tooling_path
+
+
+store = None
+push = True
+statistics = {"hits": 0, "misses": 0}
+transfer_timeout = 60  # seconds
+root_header = "TOOLING.root"
+relocated_size = 64 << 20  # bytes, larger files are binaries whose embedded paths only matter to debuggers
+
+
+def configure_artifact_store(artifacts_config):
+    # CI can point every runner at a shared store without editing the config
+    global store, push
+    artifacts_config = artifacts_config or {}
+    location = os.environ.get("TOOLING_ARTIFACT_STORE") or artifacts_config.get("store", "")
+    push = artifacts_config.get("push", True)
+    if not location:
+        store = None
+    elif location.startswith(("http://", "https://")):
+        store = location.rstrip('/')
+    else:
+        store = (main_project / location).resolve()
+
+
+def is_enabled():
+    return store is not None
+
+
+def _is_remote():
+    return isinstance(store, str)
+
+
+def _entry_path(key):
+    return store / key[:2] / (key + ".tar.gz")
+
+
+def _download(key, archive):
+    if not _is_remote():
+        entry = _entry_path(key)
+        if not entry.exists():
+            return False
+        os.utime(str(entry))
+        shutil.copyfile(str(entry), str(archive))
+        return True
+    try:
+        with urllib.request.urlopen("{}/{}.tar.gz".format(store, key), timeout=transfer_timeout) as response:
+            with open(str(archive), "wb") as destination:
+                for chunk in iter(lambda: response.read(1 << 20), b""):
+                    destination.write(chunk)
+        return True
+    except urllib.error.HTTPError as error:
+        if error.code != 404:
+            print(yellow_text("Artifact store answered {} for {}".format(error.code, key[:12])))
+        return False
+    except (urllib.error.URLError, OSError) as error:
+        print(yellow_text("Artifact store unreachable: {}".format(error)))
+        return False
+
+
+def _upload(key, archive):
+    if not _is_remote():
+        entry = _entry_path(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        staging = entry.with_name(entry.name + ".{}.partial".format(os.getpid()))
+        shutil.copyfile(str(archive), str(staging))
+        os.replace(str(staging), str(entry))
+        return True
+    with open(str(archive), "rb") as source:
+        request = urllib.request.Request("{}/{}.tar.gz".format(store, key), data=source, method="PUT",
+            headers={"Content-Length": str(archive.stat().st_size), "Content-Type": "application/gzip"})
+        try:
+            urllib.request.urlopen(request, timeout=transfer_timeout).close()
+            return True
+        except (urllib.error.URLError, OSError) as error:
+            print(yellow_text("Could not upload artifacts {}: {}".format(key[:12], error)))
+            return False
+
+
+def _is_safe(member, root):
+    # an archive from a shared store must not write, or link, anywhere outside of the project
+    if Path(member.name).is_absolute() or root not in (root / member.name).resolve().parents:
+        return False
+    if member.issym():
+        return root in ((root / member.name).parent / member.linkname).resolve().parents
+    if member.islnk():
+        return root in (root / member.linkname).resolve().parents
+    return True
+
+
+def _relocate(members, old_root, root):
+    # CMake caches, ninja files and dep-info keep the absolute paths of the checkout that built them
+    pattern = re.compile(re.escape(old_root.encode()) + rb"(?=[/\\\"';:\s]|$)")
+    for member in members:
+        if not member.isfile() or member.size > relocated_size:
+            continue
+        path = root / member.name
+        contents = path.read_bytes()
+        if b"\0" in contents[:8192] or not pattern.search(contents):
+            continue
+        path.write_bytes(pattern.sub(str(root).encode().replace(b"\\", b"\\\\"), contents))
+        # build tools compare timestamps, the rewritten files keep the ones they were archived with
+        os.utime(str(path), (member.mtime, member.mtime))
+
+
+def restore_artifacts(key, description):
+    tooling_path.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=str(tooling_path)) as scratch:
+        archive = Path(scratch) / "artifacts.tar.gz"
+        if not _download(key, archive):
+            statistics["misses"] += 1
+            print(yellow_text("Artifact cache miss") + " for {} ({})".format(description, key[:12]))
+            return False
+        root = main_project.resolve()
+        with tarfile.open(str(archive), "r:gz") as contents:
+            members = contents.getmembers()
+            if not all(_is_safe(member, root) for member in members):
+                print(yellow_text("Ignoring artifacts {}".format(key[:12])) + ", they point outside of the project")
+                statistics["misses"] += 1
+                return False
+            contents.extractall(str(root), members)
+            old_root = contents.pax_headers.get(root_header)
+        if old_root and old_root != str(root):
+            _relocate(members, old_root, root)
+    statistics["hits"] += 1
+    print(green_text("Artifact cache hit") + " for {} ({}), skipping its build".format(description, key[:12]))
+    return True
+
+
+def store_artifacts(key, directories, description):
+    directories = [directory for directory in directories if directory.exists()]
+    if not push or not directories:
+        return
+    tooling_path.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=str(tooling_path)) as scratch:
+        archive = Path(scratch) / "artifacts.tar.gz"
+        # fast compression, the archives are written after every build that missed
+        with tarfile.open(str(archive), "w:gz", compresslevel=3, format=tarfile.PAX_FORMAT,
+                pax_headers={root_header: str(main_project.resolve())}) as contents:
+            for directory in directories:
+                contents.add(str(directory), arcname=directory.resolve().relative_to(main_project.resolve()).as_posix())
+        if _upload(key, archive):
+            print("Stored artifacts of {} ({})".format(description, key[:12]))
+
+
+def report_artifact_cache():
+    reported = dict(statistics)
+    statistics.update(hits=0, misses=0)
+    if not reported["hits"] + reported["misses"]:
+        return None
+    print("Artifact cache: {} hit{}, {} miss{}".format(reported["hits"], "" if reported["hits"] == 1 else "s",
+        reported["misses"], "" if reported["misses"] == 1 else "es"))
+    return reported
@@ -0,0 +1,114 @@
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+
+
+versions = {
+    "cmake": "cmake version 3.28.0",
+    "cargo": "cargo 1.80.0",
+    "conan": "Conan version 2.3.0",
+    "ninja": "1.11.1",
+    "uv": "uv 0.9.28",
+    "git": "git version 2.45.0",
+    "gcc": "gcc (GCC) 15.2.0",
+    "g++": "g++ (GCC) 15.2.0",
+}
+
+
+build_types = ("debug", "release", "relwithdebinfo", "minsizerel")
+
+
+def touch(path, text="stub\n"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def option(arguments, name):
+    if name in arguments and arguments.index(name) + 1 < len(arguments):
+        return arguments[arguments.index(name) + 1]
+    return None
+
+
+def preset_directory(name):
+    # conan's cmake_layout: conan-<variant>-<type> builds in build/<variant>/<Type>, the multi-config conan-<variant> in build/<variant>
+    parts = name.split('-')[1:]
+    build_type = parts.pop() if parts[-1] in build_types else None
+    root = Path("build", *(['-'.join(parts)] if parts and parts != ["default"] else []))
+    return root / build_type.capitalize() if build_type else root
+
+
+def cmake(arguments):
+    preset = option(arguments, "--preset")
+    if "--build" in arguments:
+        touch((preset_directory(preset) if preset else Path(option(arguments, "--build"))) / "stub_output.bin")
+        return
+    build_dir = preset_directory(preset) if preset else Path(option(arguments, "-B") or arguments[-1])
+    touch(build_dir / "CMakeCache.txt")
+    touch(build_dir / "build.ninja", "")
+    (build_dir / "CMakeFiles").mkdir(exist_ok=True)
+
+
+def conan(arguments):
+    if arguments[:1] != ["install"]:
+        return
+    build_type = option(arguments, "--settings").split('=', 1)[1]
+    layout = [value for value in arguments if value.startswith("tools.cmake.cmake_layout:build_folder_vars=")]
+    variant = layout[0].split("'const.", 1)[1].split("'", 1)[0] if layout else None
+    multi_config = "tools.cmake.cmaketoolchain:generator=Ninja Multi-Config" in arguments
+    build_root = Path("build", *([variant] if variant else []))
+    generators = (build_root if multi_config else build_root / build_type) / "generators"
+    name = "conan-" + (variant + '-' if variant else "") + build_type.lower()
+    configure_name = ("conan-" + variant if variant else "conan-default") if multi_config else name
+    touch(generators / "conan_toolchain.cmake", "")
+    touch(generators / "CMakePresets.json", json.dumps({"version": 4, "configurePresets": [
+        {"name": configure_name, "binaryDir": str(generators.parent.resolve())}],
+        "buildPresets": [{"name": name, "configurePreset": configure_name}]}))
+    user_presets = Path("CMakeUserPresets.json")
+    contents = json.loads(user_presets.read_text()) if user_presets.exists() else {"version": 4, "include": []}
+    include = (generators / "CMakePresets.json").as_posix()
+    if include not in contents["include"]:
+        contents["include"].append(include)
+    user_presets.write_text(json.dumps(contents))
+
+
+def cargo(arguments):
+    if arguments[:1] == ["build"]:
+        profile = "release" if "--release" in arguments else "debug"
+        touch(Path("target", option(arguments, "--target") or "", profile, "stub_binary"))
+
+
+def uv(arguments):
+    if arguments[:1] != ["venv"]:
+        return
+    venv = Path(".venv")
+    touch(venv / "pyvenv.cfg", "home = {}\n".format(str(Path(sys.executable).parent)))
+    python = venv / ("Scripts/python.exe" if sys.platform == "win32" else "bin/python")
+    if not python.exists():
+        python.parent.mkdir(parents=True, exist_ok=True)
+        if sys.platform == "win32":
+            shutil.copyfile(sys.executable, str(python))
+        else:
+            python.symlink_to(sys.executable)
+
+
+def git(arguments):
+    if arguments[:1] == ["rev-parse"]:
+        print("0000000")
+
+
+def main():
+    tool, arguments = sys.argv[1], sys.argv[2:]
+    with open(os.environ["TOOLING_BENCH_LOG"], "a") as log:
+        log.write(' '.join([tool] + arguments) + '\n')
+    if arguments[:1] == ["--version"]:
+        print(versions[tool])
+        return
+    handler = {"cmake": cmake, "conan": conan, "cargo": cargo, "uv": uv, "git": git}.get(tool)
+    if handler:
+        handler(arguments)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import json
+import time
+
+from _text_colors import blue_text, green_text, red_text, yellow_text
+from _paths import main_project, history, last_used
+from _tracing import traced_run
+
+
+phases = ("conan", "configure", "cmake", "cargo")
+minimal_regression = 0.5  # seconds, shorter differences are noise
+
+
+def get_git_revision():
+    result = traced_run(["git", "rev-parse", "--short", "HEAD"], cwd=str(main_project), capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def append_record(record):
+    history.parent.mkdir(parents=True, exist_ok=True)
+    with open(str(history), "a") as store:
+        store.write(json.dumps(record, sort_keys=True) + '\n')
+    if record.get("last_used"):
+        # the history only grows, a plain rebuild reads this small pointer instead
+        last_used.write_text(json.dumps({"config": record["config"], "toolchain": record.get("toolchain")}))
+
+
+def read_records():
+    if not history.exists():
+        return []
+    records = []
+    for line in history.read_text().splitlines():
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            print(yellow_text("Skipping a broken line") + " in " + str(history))
+    return records
+
+
+def _read_last_used():
+    if not last_used.exists():
+        return {}
+    text = last_used.read_text()
+    try:
+        return json.loads(text)
+    except ValueError:
+        # builds made before the history existed only left the config name
+        return {"config": text.strip()}
+
+
+def last_used_config():
+    config = _read_last_used().get("config")
+    return config if config in ("Debug", "Release") else None
+
+
+def last_used_variant():
+    # the toolchain and option set the last used config was built with
+    return _read_last_used().get("toolchain")
+
+
+def record_clean():
+    if history.exists():
+        print("Wiping the last used build configuration")
+        append_record({"event": "clean", "time": time.time()})
+    if last_used.exists():
+        last_used.unlink()
+
+
+def median(samples):
+    ordered = sorted(samples)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def _comparable(record, candidate):
+    return (candidate.get("event") == "build" and candidate.get("status") == "succeeded"
+        and candidate.get("config") == record.get("config") and candidate.get("toolchain") == record.get("toolchain"))
+
+
+def find_regressions(record, earlier, threshold, window):
+    # every phase is compared to the median of the same phase over the last successful comparable builds
+    baseline_records = [candidate for candidate in earlier if _comparable(record, candidate)][-window:]
+    regressions = []
+    for phase in phases:
+        duration = record.get("phases", {}).get(phase)
+        samples = [candidate["phases"][phase] for candidate in baseline_records if phase in candidate.get("phases", {})]
+        if duration is None or len(samples) < 3:
+            continue
+        baseline = median(samples)
+        if duration > baseline * (1 + threshold) and duration - baseline > minimal_regression:
+            regressions.append((phase, duration, baseline))
+    return regressions
+
+
+def warn_regressions(record, threshold, window):
+    earlier = read_records()[:-1]
+    for phase, duration, baseline in find_regressions(record, earlier, threshold, window):
+        print(red_text("{} {} took {:.1f}s".format(record["config"], phase, duration))
+            + " against a baseline of {:.1f}s (+{:.0f}%)".format(baseline, 100 * (duration / baseline - 1)))
+
+
+def format_rate(cache):
+    if not cache:
+        return "-"
+    total = cache["hits"] + cache["misses"]
+    return "{:.0f}%".format(100.0 * cache["hits"] / total) if total else "-"
+
+
+def print_history(count, threshold, window):
+    records = read_records()
+    builds = [(index, record) for index, record in enumerate(records) if record.get("event") == "build"]
+    if not builds:
+        print("No builds recorded in " + str(history))
+        return
+
+    print("{:<17} {:<8} {:<24} {:<10} {:>8} {:>10} {:>8} {:>8} {:>7} {:>7}  {}".format("time", "config", "toolchain", "revision",
+        *phases, "conan$", "cc$", "status"))
+    flagged = 0
+    for index, record in builds[-count:]:
+        regressions = {phase for phase, _, _ in find_regressions(record, records[:index], threshold, window)}
+        cells = []
+        for phase in phases:
+            value = record.get("phases", {}).get(phase)
+            cell = ("{:.1f}s".format(value) if value is not None else "-").rjust(10 if phase == "configure" else 8)
+            cells.append(red_text(cell) if phase in regressions else cell)
+        status = green_text(record["status"]) if record["status"] == "succeeded" else red_text(record["status"])
+        print("{:<17} {:<8} {:<24} {:<10} {} {:>7} {:>7}  {}".format(
+            time.strftime("%Y-%m-%d %H:%M", time.localtime(record["time"])), record["config"], record.get("toolchain", "-"),
+            record.get("revision") or "-", ' '.join(cells), format_rate(record.get("conan_cache")),
+            format_rate(record.get("compiler_cache")), status))
+        flagged += bool(regressions)
+
+    if flagged:
+        print(yellow_text("{} build{} regressed".format(flagged, "" if flagged == 1 else "s"))
+            + " beyond {:.0f}% of the median of the previous {} comparable builds".format(100 * threshold, window))
+    print("History is stored in " + blue_text(str(history)))
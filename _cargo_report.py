@@ -0,0 +1,95 @@
+import json
+import re
+import shutil
+import time
+from pathlib import Path
+
+from _text_colors import blue_text, green_text
+
+
+slowest_count = 10
+kept_reports = 20
+
+saved_report = re.compile(r"Timing report saved to (.+\.html)")
+unit_data = re.compile(r"const UNIT_DATA = (\[.*?\]);", re.DOTALL)
+
+
+class CargoMessages:
+    def __init__(self):
+        self.rebuilt = []
+        self.fresh = 0
+        self.executables = []
+        self.proc_macros = set()
+        self.timing_report = None
+
+    def handle_line(self, line):
+        # cargo's own status lines stay as they are, the json messages on stdout are consumed here
+        if not line.startswith('{'):
+            match = saved_report.search(line)
+            if match:
+                self.timing_report = Path(match.group(1).strip())
+            return line
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return line
+
+        reason = message.get("reason")
+        if reason == "compiler-message":
+            # the json format replaces the diagnostics cargo would print, so they are shown as rendered
+            return message["message"].get("rendered")
+        if reason == "compiler-artifact":
+            target = message["target"]
+            if "proc-macro" in target["kind"]:
+                self.proc_macros.add(target["name"].replace('-', '_'))
+            if message["fresh"]:
+                self.fresh += 1
+            else:
+                self.rebuilt.append(target["name"])
+            if message.get("executable"):
+                self.executables.append(message["executable"])
+        return None
+
+
+def read_unit_durations(timing_report):
+    # the html report embeds every compiled unit as json
+    match = unit_data.search(timing_report.read_text(errors="replace"))
+    if not match:
+        return []
+    units = []
+    for unit in json.loads(match.group(1)):
+        name = unit["name"] + ("" if unit["mode"] == "todo" else " (" + unit["mode"] + ")")
+        units.append({"crate": name, "version": unit["version"], "seconds": round(unit["duration"], 2)})
+    return sorted(units, key=lambda unit: unit["seconds"], reverse=True)
+
+
+def archive_timing_report(timing_report, report_dir, name):
+    # cargo overwrites its report with every build, a copy stays with the history record
+    archive_dir = report_dir / "cargo-timings"
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    archived = archive_dir / "{}-{}.html".format(time.strftime("%Y%m%d-%H%M%S"), name)
+    shutil.copyfile(str(timing_report), str(archived))
+    for stale in sorted(archive_dir.glob("*.html"))[:-kept_reports]:
+        stale.unlink()
+    return archived
+
+
+def summarize_cargo_build(messages, report_dir, name):
+    units = []
+    archived = None
+    if messages.timing_report and messages.timing_report.exists():
+        units = read_unit_durations(messages.timing_report)
+        archived = archive_timing_report(messages.timing_report, report_dir, name)
+    for unit in units:
+        unit["proc_macro"] = unit["crate"].replace('-', '_') in messages.proc_macros
+
+    print("Cargo: " + blue_text("{} rebuilt".format(len(messages.rebuilt))) + ", {} fresh".format(messages.fresh))
+    for unit in units[:slowest_count]:
+        print("  {:>7.2f}s  {} {}{}".format(unit["seconds"], unit["crate"], unit["version"],
+            " (proc-macro)" if unit["proc_macro"] else ""))
+    for executable in messages.executables:
+        print("  " + green_text(executable))
+    if archived:
+        print("Cargo timings: " + blue_text(str(archived)))
+    return {"rebuilt": len(messages.rebuilt), "fresh": messages.fresh, "slowest": units[:slowest_count],
+        "timings": str(archived) if archived else None}
@@ -0,0 +1,79 @@
+import json
+import queue
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from _tracing import traced_popen
+
+
+idle_timeout = 120  # seconds without any progress before the index is considered complete
+overall_timeout = 3600
+
+
+def send(process, message):
+    body = json.dumps(dict(message, jsonrpc="2.0")).encode()
+    process.stdin.write("Content-Length: {}\r\n\r\n".format(len(body)).encode() + body)
+    process.stdin.flush()
+
+
+def read_messages(stream, messages):
+    while True:
+        length = None
+        while True:
+            line = stream.readline()
+            if not line:
+                messages.put(None)
+                return
+            if not line.strip():
+                break
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b"content-length":
+                length = int(value)
+        messages.put(json.loads(stream.read(length)) if length else {})
+
+
+def warm_up(clangd, root):
+    # clangd builds its background index for the whole database once any file of it is open,
+    # the index lands in .cache/clangd next to compile_commands.json where the editor's clangd finds it
+    entries = json.loads((root / "compile_commands.json").read_text())
+    if not entries:
+        return
+    source = (Path(entries[0]["directory"]) / entries[0]["file"]).resolve()
+    process = traced_popen([clangd, "--background-index", "--compile-commands-dir=" + str(root), "--log=error"],
+        cwd=str(root), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    messages = queue.Queue()
+    threading.Thread(target=read_messages, args=(process.stdout, messages), daemon=True).start()
+
+    send(process, {"id": 1, "method": "initialize", "params": {"processId": None, "rootUri": root.as_uri(),
+        "capabilities": {"window": {"workDoneProgress": True}}}})
+    send(process, {"method": "initialized", "params": {}})
+    send(process, {"method": "textDocument/didOpen", "params": {"textDocument": {"uri": source.as_uri(), "languageId": "cpp",
+        "version": 1, "text": source.read_text(errors="replace")}}})
+
+    deadline = time.monotonic() + overall_timeout
+    while time.monotonic() < deadline:
+        try:
+            message = messages.get(timeout=idle_timeout)
+        except queue.Empty:
+            break
+        if message is None:
+            return
+        if message.get("method") == "window/workDoneProgress/create":
+            send(process, {"id": message["id"], "result": None})
+        elif message.get("method") == "$/progress" and message["params"]["token"] == "backgroundIndexProgress" \
+                and message["params"]["value"].get("kind") == "end":
+            break
+
+    send(process, {"id": 2, "method": "shutdown"})
+    send(process, {"method": "exit"})
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+if __name__ == "__main__":
+    warm_up(sys.argv[1], Path(sys.argv[2]))
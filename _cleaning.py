@@ -0,0 +1,179 @@
+import json
+import os
+import shlex
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from _platform_specific import start_detached
+from _text_colors import blue_text, green_text, yellow_text
+from _paths import trash_dir, script_dir, main_project
+
+
+def move_to_trash(path):
+    # a rename returns immediately, the actual deletion happens in the background
+    trash_dir.mkdir(parents=True, exist_ok=True)
+    destination = trash_dir / "{}-{}-{}".format(time.strftime("%Y%m%d%H%M%S"), os.getpid(), path.name)
+    suffix = 0
+    while destination.exists():
+        suffix += 1
+        destination = destination.with_name(destination.name + "-{}".format(suffix))
+    try:
+        path.rename(destination)
+        return True
+    except OSError as error:
+        print(yellow_text("Could not move {} aside: {}".format(str(path), error)) + ", deleting it in place")
+        shutil.rmtree(path, ignore_errors=True)
+        return False
+
+
+def start_background_purge():
+    if trash_dir.exists() and any(trash_dir.iterdir()):
+        start_detached([sys.executable, str(script_dir / "build.py"), "--purge-trash"], main_project)
+
+
+def _remove(path):
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+
+def purge_trash():
+    if not trash_dir.exists():
+        return
+    # the first two levels are fanned out to the workers, the rest is deleted by each of them
+    entries = [entry for entry in trash_dir.iterdir()]
+    work = []
+    for entry in entries:
+        if entry.is_dir() and not entry.is_symlink():
+            for child in entry.iterdir():
+                work += list(child.iterdir()) if child.is_dir() and not child.is_symlink() else [child]
+        else:
+            work.append(entry)
+    with ThreadPoolExecutor(max_workers=min(32, 2 * (os.cpu_count() or 1))) as pool:
+        list(pool.map(_remove, work))
+    for entry in entries:
+        _remove(entry)
+
+
+def directory_size(path):
+    total = 0
+    try:
+        entries = list(os.scandir(str(path)))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                total += directory_size(entry.path)
+            else:
+                total += entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            pass
+    return total
+
+
+def last_used_time(path):
+    # the newest top-level entry approximates when a tree was last built
+    try:
+        return max([entry.stat().st_mtime for entry in os.scandir(str(path))] + [path.stat().st_mtime])
+    except (OSError, ValueError):
+        return 0
+
+
+def compile_output(entry):
+    if "output" in entry:
+        return entry["output"]
+    arguments = entry.get("arguments") or shlex.split(entry.get("command", ""), posix=sys.platform != "win32")
+    for index, argument in enumerate(arguments):
+        if argument == "-o" and index + 1 < len(arguments):
+            return arguments[index + 1]
+        if argument.startswith(("/Fo", "-Fo")):
+            return argument[3:]
+    return None
+
+
+def find_stale_objects(build_dir):
+    # objects no longer produced by any compile command belong to deleted or renamed sources
+    database = build_dir / "compile_commands.json"
+    if not database.exists():
+        return []
+    try:
+        commands = json.loads(database.read_text())
+    except ValueError:
+        return []
+    produced = set()
+    for entry in commands:
+        output = compile_output(entry)
+        if output:
+            produced.add(os.path.normpath(os.path.join(entry.get("directory", str(build_dir)), output)))
+    if not produced:
+        return []
+    stale = []
+    for directory, subdirectories, files in os.walk(str(build_dir)):
+        # nested builds configured on their own, like ExternalProject binary dirs, keep their objects
+        subdirectories[:] = [name for name in subdirectories if not os.path.exists(os.path.join(directory, name, "CMakeCache.txt"))]
+        # only CMake's object directories are scanned, cargo or other tools may build next to them
+        if "CMakeFiles" not in Path(directory).relative_to(build_dir).parts:
+            continue
+        for name in files:
+            if name.endswith((".o", ".obj")) and os.path.normpath(os.path.join(directory, name)) not in produced:
+                stale.append(Path(directory) / name)
+    return stale
+
+
+def find_build_trees(cmake_directory, rust_directory):
+    trees = []
+    if cmake_directory and (cmake_directory / "build").is_dir():
+        # trees nested in another one, like FetchContent sub-builds, go together with their parent
+        caches = sorted((cmake_directory / "build").rglob("CMakeCache.txt"), key=lambda cache: len(cache.parts))
+        for cache in caches:
+            if not any(tree in cache.parents for _, tree in trees):
+                trees.append(("CMake", cache.parent))
+    if rust_directory and (rust_directory / "target").is_dir():
+        for incremental in (rust_directory / "target").glob("**/incremental/*"):
+            trees.append(("Cargo incremental", incremental))
+        for fingerprint in (rust_directory / "target").glob("**/.fingerprint"):
+            trees.append(("Cargo", fingerprint.parent))
+    return trees
+
+
+def format_size(size):
+    return "{:.2f} GB".format(size / (1 << 30))
+
+
+def prune(cmake_directory, rust_directory, budget):
+    roots = [path for path in ((cmake_directory / "build") if cmake_directory else None,
+        (rust_directory / "target") if rust_directory else None) if path and path.exists()]
+
+    for tree in [tree for _, tree in find_build_trees(cmake_directory, None)]:
+        stale = find_stale_objects(tree)
+        if stale:
+            print("Removing {} stale object file{} from {}".format(len(stale), "" if len(stale) == 1 else "s", str(tree)))
+            for path in stale:
+                path.unlink()
+
+    used = sum(directory_size(root) for root in roots)
+    print("Build artifacts take " + blue_text(format_size(used)) + " of a " + format_size(budget) + " budget")
+    if used <= budget:
+        return
+
+    # least recently used first; sizes are measured at eviction time, so nested trees are never counted twice
+    candidates = sorted(find_build_trees(cmake_directory, rust_directory), key=lambda item: last_used_time(item[1]))
+    for kind, tree in candidates:
+        if used <= budget:
+            break
+        if not tree.exists():
+            continue
+        size = directory_size(tree)
+        print("Evicting {} {} ({})".format(kind, str(tree), format_size(size)))
+        move_to_trash(tree)
+        used -= size
+    print(green_text("Pruned to " + format_size(max(used, 0))))
+    start_background_purge()
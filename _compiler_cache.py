@@ -0,0 +1,91 @@
+import json
+import os
+
+from _text_colors import green_text, yellow_text
+from _paths import main_project
+from _toolchain import find_tool
+from _tracing import traced_run
+
+
+launcher = None
+rust_wrapper = None
+
+supported_launchers = ("ccache", "sccache")
+
+
+def configure_compiler_cache(cache_config):
+    global launcher, rust_wrapper
+    launcher = None
+    rust_wrapper = None
+    if not cache_config or not cache_config.get("launcher"):
+        return
+
+    requested = cache_config["launcher"]
+    if requested not in supported_launchers:
+        print(yellow_text("Unknown compiler cache {}".format(requested)) + ", expected one of: " + ', '.join(supported_launchers))
+        return
+    if find_tool(requested) is None:
+        print(yellow_text("{} is not installed".format(requested)) + ", building without a compiler cache")
+        return
+
+    launcher = requested
+    directory = cache_config.get("directory")
+    max_size = cache_config.get("max_size")
+    if isinstance(max_size, (int, float)):
+        # a bare number is gigabytes, sccache would otherwise read it as bytes
+        max_size = "{:g}G".format(max_size)
+    if launcher == "ccache":
+        if directory:
+            os.environ["CCACHE_DIR"] = str((main_project / directory).resolve())
+        if max_size:
+            os.environ["CCACHE_MAXSIZE"] = max_size
+    else:
+        if directory:
+            os.environ["SCCACHE_DIR"] = str((main_project / directory).resolve())
+        if max_size:
+            os.environ["SCCACHE_CACHE_SIZE"] = max_size
+
+    # ccache can not wrap rustc, so cargo is only cached with sccache
+    if launcher == "sccache":
+        rust_wrapper = launcher
+        os.environ["RUSTC_WRAPPER"] = find_tool(launcher)
+    print("Compiler cache:\t\t" + green_text(launcher) + (" (C/C++ only)" if not rust_wrapper else ""))
+
+
+def get_launcher_flags():
+    if not launcher:
+        # a launcher configured earlier stays in the CMake cache until it is removed explicitly
+        return ["-UCMAKE_C_COMPILER_LAUNCHER", "-UCMAKE_CXX_COMPILER_LAUNCHER"]
+    return ["-DCMAKE_C_COMPILER_LAUNCHER={}".format(launcher), "-DCMAKE_CXX_COMPILER_LAUNCHER={}".format(launcher)]
+
+
+def snapshot_statistics():
+    # the caches are shared, so hits and misses of this build are the difference between two snapshots
+    if launcher == "ccache":
+        result = traced_run(["ccache", "--print-stats"], capture_output=True, text=True)
+        counters = dict(line.split('\t', 1) for line in result.stdout.splitlines() if '\t' in line)
+        count = lambda name: int(counters.get(name, 0))
+        return {"hits": count("direct_cache_hit") + count("preprocessed_cache_hit"), "misses": count("cache_miss")}
+    if launcher == "sccache":
+        result = traced_run(["sccache", "--show-stats", "--stats-format=json"], capture_output=True, text=True)
+        try:
+            stats = json.loads(result.stdout)["stats"]
+        except (ValueError, KeyError):
+            return None
+        return {"hits": sum(stats.get("cache_hits", {}).get("counts", {}).values()),
+            "misses": sum(stats.get("cache_misses", {}).get("counts", {}).values())}
+    return None
+
+
+def report_compiler_cache(before):
+    if not before:
+        return None
+    after = snapshot_statistics()
+    if not after:
+        return None
+    hits = after["hits"] - before["hits"]
+    misses = after["misses"] - before["misses"]
+    total = hits + misses
+    rate = 100.0 * hits / total if total else 0.0
+    print("Compiler cache ({}): {} hits, {} misses, {:.1f}% hit rate".format(launcher, hits, misses, rate))
+    return {"hits": hits, "misses": misses}
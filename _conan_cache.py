@@ -0,0 +1,85 @@
+import json
+import re
+import shutil
+from pathlib import Path
+
+from _text_colors import green_text, yellow_text
+from _paths import conan_cache
+from _toolchain import get_version_output
+
+
+statistics = {"hits": 0, "misses": 0}
+
+
+def get_conan_version():
+    try:
+        from conan import conan_version
+        return str(conan_version)
+    except ImportError:
+        return (get_version_output("conan") or "").strip()
+
+
+def _referenced_packages(generators_dir):
+    # the generated cmake data files point into the local conan package cache, which might have been purged
+    folders = []
+    for data_file in generators_dir.glob("*-data.cmake"):
+        folders += re.findall(r'_PACKAGE_FOLDER_\w+\s+"([^"]+)"', data_file.read_text(errors="replace"))
+    return folders
+
+
+def _include_user_preset(cmake_directory, generators_dir):
+    user_presets = cmake_directory / "CMakeUserPresets.json"
+    preset = (generators_dir / "CMakePresets.json").relative_to(cmake_directory).as_posix()
+    contents = {"version": 4, "vendor": {"conan": {}}, "include": []}
+    if user_presets.exists():
+        contents = json.loads(user_presets.read_text())
+    if preset not in contents.setdefault("include", []):
+        contents["include"].append(preset)
+        user_presets.write_text(json.dumps(contents, indent=4) + '\n')
+
+
+def restore_conan_install(key, cmake_directory, build_dir):
+    entry = conan_cache / key
+    generators_dir = build_dir / "generators"
+    if not (entry / "generators").is_dir():
+        statistics["misses"] += 1
+        print(yellow_text("Conan cache miss") + " for " + key[:12])
+        return False
+
+    missing = [folder for folder in _referenced_packages(entry / "generators") if not Path(folder).exists()]
+    if missing:
+        statistics["misses"] += 1
+        print(yellow_text("Conan cache entry {} is stale".format(key[:12])) + ", missing package " + missing[0])
+        shutil.rmtree(entry)
+        return False
+
+    # merged rather than replaced, a multi-config tree keeps the files of every config side by side
+    shutil.copytree(entry / "generators", generators_dir, dirs_exist_ok=True)
+    _include_user_preset(cmake_directory, generators_dir)
+    statistics["hits"] += 1
+    print(green_text("Conan cache hit") + " for " + key[:12] + ", restored " + str(generators_dir))
+    return True
+
+
+def store_conan_install(key, build_dir):
+    generators_dir = build_dir / "generators"
+    if not generators_dir.is_dir():
+        return
+    entry = conan_cache / key
+    staging = conan_cache / (key + ".partial")
+    if staging.exists():
+        shutil.rmtree(staging)
+    shutil.copytree(generators_dir, staging / "generators")
+    if entry.exists():
+        shutil.rmtree(entry)
+    staging.rename(entry)
+
+
+def report_conan_cache():
+    reported = dict(statistics)
+    statistics.update(hits=0, misses=0)
+    if not reported["hits"] + reported["misses"]:
+        return None
+    print("Conan cache: {} hit{}, {} miss{}".format(reported["hits"], "" if reported["hits"] == 1 else "s",
+        reported["misses"], "" if reported["misses"] == 1 else "es"))
+    return reported
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+from _paths import main_project, configured
+
+
+skipped_directories = {"build", "target", ".git", ".tools", ".venv"}
+
+
+def hash_file(path, digest=None):
+    digest = digest or hashlib.sha256()
+    with open(str(path), "rb") as source:
+        for chunk in iter(lambda: source.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest
+
+
+def hash_values(*values):
+    digest = hashlib.sha256()
+    for value in values:
+        digest.update(json.dumps(value, sort_keys=True, default=str).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def collect_files(root, predicate):
+    found = []
+    for directory, subdirectories, files in os.walk(str(root)):
+        subdirectories[:] = sorted(d for d in subdirectories if d not in skipped_directories and not d.startswith('.'))
+        found += [Path(directory) / name for name in sorted(files) if predicate(name)]
+    return found
+
+
+def is_cmake_input(name):
+    return name == "CMakeLists.txt" or name.endswith(".cmake")
+
+
+def profile_contents(profile_path):
+    # conan profiles pull their components in via include(), which have to be part of the contents
+    profile_path = Path(profile_path)
+    contents = profile_path.read_text()
+    for included in re.findall(r"^\s*include\((.+)\)\s*$", contents, re.MULTILINE):
+        contents += profile_contents((profile_path.parent / included.strip()).resolve())
+    return contents
+
+
+def fingerprint_files(files, digest=None, root=None):
+    # with a root the paths are hashed relative to it, so checkouts in different places agree
+    digest = digest or hashlib.sha256()
+    for path in files:
+        digest.update((Path(path).relative_to(root).as_posix() if root else str(path)).encode() + b"\0")
+        if path.exists():
+            hash_file(path, digest)
+    return digest
+
+
+def _stamp_path(build_dir):
+    build_dir = Path(build_dir).resolve()
+    try:
+        name = build_dir.relative_to(main_project.resolve()).as_posix().replace('/', '_')
+    except ValueError:
+        name = hash_values(str(build_dir))
+    return configured / (name + ".sha256")
+
+
+def is_configured(build_dir, fingerprint):
+    stamp = _stamp_path(build_dir)
+    intact = (build_dir / "CMakeCache.txt").exists() and (build_dir / "CMakeFiles").is_dir()
+    return intact and stamp.exists() and stamp.read_text() == fingerprint
+
+
+def record_configure(build_dir, fingerprint):
+    stamp = _stamp_path(build_dir)
+    stamp.parent.mkdir(parents=True, exist_ok=True)
+    stamp.write_text(fingerprint)
+
+
+def forget_configure(build_dir):
+    stamp = _stamp_path(build_dir)
+    if stamp.exists():
+        stamp.unlink()
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import sys
+import time
+
+from _platform_specific import start_detached
+from _text_colors import blue_text, green_text, yellow_text
+from _paths import main_project, script_dir, compile_db, warmup_stamp
+from _toolchain import find_tool
+
+
+database_patterns = ("compile_commands.json", "*/compile_commands.json", "*/*/compile_commands.json")
+
+
+def write_if_changed(path, text):
+    # editors watch these files, an unchanged one must not trigger a reload or a reindex
+    if path.exists() and path.read_text() == text:
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    staging = path.with_name(path.name + ".{}.partial".format(os.getpid()))
+    staging.write_text(text)
+    os.replace(str(staging), str(path))
+    return True
+
+
+def find_compile_database(cmake_directory, latest_dir):
+    # only the last built tree is used, other variants may carry stale flags for the files they share with it
+    latest = latest_dir / "compile_commands.json" if latest_dir else None
+    if latest and latest.exists():
+        return latest
+    build_root = cmake_directory / "build"
+    databases = [path for pattern in database_patterns for path in build_root.glob(pattern)]
+    return max(databases, key=lambda path: path.stat().st_mtime) if databases else None
+
+
+def merge_compile_commands(cmake_directory, latest_dir):
+    # every file appears once, compiled in several targets it keeps the first command
+    merged = []
+    seen = set()
+    database = find_compile_database(cmake_directory, latest_dir)
+    try:
+        entries = json.loads(database.read_text()) if database else []
+    except ValueError:
+        print(yellow_text("Skipping a broken {}".format(database)))
+        entries = []
+    for entry in entries:
+        source = os.path.normcase(os.path.normpath(os.path.join(entry["directory"], entry["file"])))
+        if source not in seen:
+            seen.add(source)
+            merged.append(entry)
+    if not merged:
+        print(yellow_text("No compile_commands.json yet") + ", build once and relaunch for a complete C++ index")
+        return False
+    changed = write_if_changed(compile_db, json.dumps(merged, indent=2))
+    print("Compile commands:\t" + blue_text(str(compile_db)) + " ({} files from {}{})".format(len(merged),
+        database.parent.relative_to(cmake_directory).as_posix(), "" if changed else ", unchanged"))
+    return True
+
+
+def configure_rust_analyzer(settings_path, rust_directory, features, zed):
+    # the rust project lives in a subdirectory, rust-analyzer is pointed at it and at the target dir build.py fills;
+    # a rust-project.json would replace cargo's own crate graph, which rust-analyzer reads from Cargo.toml just fine
+    options = {"linkedProjects": [(rust_directory / "Cargo.toml").relative_to(main_project).as_posix()],
+        "cargo": {"targetDir": (rust_directory / "target").as_posix(), "features": features}}
+    try:
+        settings = json.loads(settings_path.read_text()) if settings_path.exists() else {}
+    except ValueError:
+        print(yellow_text("Could not parse {}".format(settings_path)) + ", add the rust-analyzer settings yourself: " + json.dumps(options))
+        return
+    if zed:
+        settings.setdefault("lsp", {}).setdefault("rust-analyzer", {}).setdefault("initialization_options", {}).update(options)
+    else:
+        settings.update({"rust-analyzer.linkedProjects": options["linkedProjects"],
+            "rust-analyzer.cargo.targetDir": options["cargo"]["targetDir"], "rust-analyzer.cargo.features": features})
+    if write_if_changed(settings_path, json.dumps(settings, indent=4) + '\n'):
+        print("rust-analyzer:\t\t" + blue_text(str(settings_path)))
+
+
+def start_index_warmup():
+    clangd = find_tool("clangd")
+    if not clangd:
+        print(yellow_text("clangd can not be found") + ", the editor builds its index on its own")
+        return
+    # one warm-up per database, clangd keeps its index up to date incrementally afterwards
+    digest = hashlib.sha256(compile_db.read_bytes()).hexdigest()
+    try:
+        stamp = json.loads(warmup_stamp.read_text())
+    except (OSError, ValueError):
+        stamp = {}
+    if stamp.get("digest") == digest:
+        return
+    warmup_stamp.parent.mkdir(parents=True, exist_ok=True)
+    warmup_stamp.write_text(json.dumps({"digest": digest, "started": time.time()}))
+    start_detached([sys.executable, str(script_dir / "_clangd_warmup.py"), clangd, str(main_project)], main_project)
+    print(green_text("Warming up the clangd index") + " in the background")
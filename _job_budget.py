@@ -0,0 +1,114 @@
+import os
+import re
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import _scheduler
+from _platform_specific import get_memory
+from _text_colors import blue_text
+from _toolchain import get_version
+
+
+compile_memory = 1024 << 20
+link_memory = 4096 << 20
+tool_parallelism = None
+
+
+def configure_job_budget(jobs_config):
+    global compile_memory, link_memory
+    jobs_config = jobs_config or {}
+    compile_memory = int(jobs_config.get("compile_memory_mb", 1024)) << 20
+    link_memory = int(jobs_config.get("link_memory_mb", 4096)) << 20
+
+
+def get_core_count():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def get_pool_sizes():
+    # pools end up in the CMake cache, so they follow the total memory to stay stable between builds
+    total, _ = get_memory()
+    cores = get_core_count()
+    compile_jobs = max(1, min(cores, total // compile_memory))
+    return compile_jobs, max(1, min(compile_jobs, total // link_memory))
+
+
+def get_job_pool_flags():
+    compile_jobs, link_jobs = get_pool_sizes()
+    return ["-DCMAKE_JOB_POOLS:STRING=compile={};link={}".format(compile_jobs, link_jobs),
+        "-DCMAKE_JOB_POOL_COMPILE:STRING=compile", "-DCMAKE_JOB_POOL_LINK:STRING=link"]
+
+
+def get_parallelism():
+    # what fits into the memory available right now
+    _, available = get_memory()
+    return max(1, min(get_core_count(), available // compile_memory))
+
+
+def get_tool_version(tool):
+    return get_version(tool)[:2]
+
+
+def get_tool_parallelism():
+    return tool_parallelism
+
+
+@contextmanager
+def shared_jobserver(clients, use_ninja):
+    # one GNU make jobserver is shared by ninja, make and cargo, so running them side by side stays within budget
+    global tool_parallelism
+    jobs = get_parallelism()
+    tool_parallelism = max(1, jobs // max(1, clients))
+    previous = {name: os.environ.get(name) for name in ("MAKEFLAGS", "CARGO_BUILD_JOBS")}
+    inherited = "jobserver" in (previous["MAKEFLAGS"] or "")
+    directory = None
+    descriptors = ()
+    compile_jobs, link_jobs = get_pool_sizes()
+    print("Parallelism:\t\t" + blue_text("{} job{}".format(jobs, "" if jobs == 1 else "s")) + " ({} compiles, {} links per ninja tree)".format(compile_jobs, link_jobs))
+    try:
+        if not inherited and sys.platform != "win32":
+            # ninja joins a jobserver since 1.13 and only through a fifo, GNU make understands a fifo since 4.4
+            if use_ninja or get_tool_version("make") >= (4, 4):
+                directory = tempfile.mkdtemp(prefix="jobserver-")
+                path = os.path.join(directory, "fifo")
+                os.mkfifo(path)
+                descriptors = (os.open(path, os.O_RDWR | os.O_NONBLOCK),)
+                authorization = "fifo:" + path
+            else:
+                # older make only knows inherited pipe descriptors, which every spawned tool has to be handed
+                descriptors = os.pipe()
+                authorization = "{},{}".format(*descriptors)
+                _scheduler.inherited_descriptors = descriptors
+            # every client owns an implicit token, the jobserver holds the rest
+            os.write(descriptors[-1], b'+' * max(0, jobs - clients))
+            os.environ["MAKEFLAGS"] = "-j{} --jobserver-auth={}".format(jobs, authorization)
+            os.environ["CARGO_BUILD_JOBS"] = str(jobs)
+        else:
+            os.environ["CARGO_BUILD_JOBS"] = str(tool_parallelism)
+            # a --matrix child joins its parent's jobserver, a pipe has to be handed on to the tools
+            inherited_pipe = re.search(r"--jobserver-(?:auth|fds)=(\d+),(\d+)", previous["MAKEFLAGS"] or "")
+            if inherited_pipe:
+                _scheduler.inherited_descriptors = tuple(int(descriptor) for descriptor in inherited_pipe.groups())
+        yield
+    finally:
+        tool_parallelism = None
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        _scheduler.inherited_descriptors = ()
+        for descriptor in descriptors:
+            os.close(descriptor)
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def uses_jobserver(use_ninja):
+    if sys.platform == "win32" or "jobserver" not in os.environ.get("MAKEFLAGS", ""):
+        return False
+    return get_tool_version("ninja") >= (1, 13) if use_ninja else True
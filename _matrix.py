@@ -0,0 +1,42 @@
+import itertools
+import json
+import os
+import sys
+
+from _scheduler import Job, run_jobs, run_command
+from _text_colors import blue_text, green_text, red_text, yellow_text
+from _paths import script_dir
+
+
+matrix_keys = ("compiler", "use_ninja", "shared_libs")
+
+
+def get_matrix_entries(matrix_config, cmake_config):
+    # every axis missing from [matrix] keeps the single value of [cmake]
+    axes = []
+    for key in matrix_keys:
+        values = matrix_config.get(key, [cmake_config[key]] if key in cmake_config else [])
+        axes.append([(key, value) for value in (values if isinstance(values, list) else [values])])
+    return [dict(entry) for entry in itertools.product(*[axis for axis in axes if axis])]
+
+
+def build_entry(entry, build_type, arguments=()):
+    # a child build.py per combination, it finds the overrides in its environment and builds into its own tree
+    command = [sys.executable, str(script_dir / "build.py"), "--config=" + build_type, "--only=cmake"] + list(arguments)
+    return run_command(command, os.getcwd(), dict(os.environ, TOOLING_MATRIX_ENTRY=json.dumps(entry))).returncode == 0
+
+
+def run_matrix(entries, names, build_configs, budget):
+    jobs = []
+    for entry, name in zip(entries, names):
+        for build_type in build_configs:
+            jobs.append(Job(name + ' ' + build_type, lambda entry=entry, build_type=build_type: build_entry(entry, build_type),
+                (), build_type))
+    print(blue_text("Building {} combination{}".format(len(jobs), "" if len(jobs) == 1 else "s")) + " with up to {} at once".format(budget))
+    succeeded = run_jobs(jobs, budget)
+
+    print("\n{:<32} {:>9}  {}".format("combination", "duration", "status"))
+    for job in jobs:
+        status = {"succeeded": green_text, "failed": red_text}.get(job.state, yellow_text)(job.state)
+        print("{:<32} {:>8.1f}s  {}".format(job.name, job.duration, status))
+    return succeeded
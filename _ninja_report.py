@@ -0,0 +1,269 @@
+import json
+import re
+from pathlib import Path
+
+from _text_colors import blue_text, green_text, red_text, yellow_text
+
+
+slowest_count = 15
+timeline_buckets = 40
+
+rule_target = re.compile(r"^\w+?_(?:COMPILER|[A-Z_]*LINKER)__(.+?)(?:_unscanned)?_[^_]+$")
+object_target = re.compile(r"CMakeFiles/([^/]+)\.dir/")
+
+
+class Edge:
+    def __init__(self, outputs, start, end):
+        self.outputs = outputs
+        self.start = start
+        self.end = end
+        self.rule = None
+        self.inputs = []
+        self.target = None
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+def read_ninja_log(log_path):
+    # the log accumulates every build, a new build begins when end times go backwards
+    entries = {}
+    last_end = 0
+    for line in log_path.read_text(errors="replace").splitlines():
+        if line.startswith('#'):
+            continue
+        fields = line.split('\t')
+        if len(fields) < 5:
+            continue
+        start, end, output, command_hash = int(fields[0]), int(fields[1]), fields[3], fields[4]
+        if end < last_end:
+            entries = {}
+        last_end = end
+        entries[output] = (start, end, command_hash)
+
+    edges = {}
+    for output, (start, end, command_hash) in entries.items():
+        edge = edges.setdefault((start, end, command_hash), Edge([], start, end))
+        edge.outputs.append(output)
+    return list(edges.values())
+
+
+def _split_unescaped(text):
+    # paths in build statements escape spaces, colons and dollars with $
+    tokens, current, index = [], "", 0
+    while index < len(text):
+        character = text[index]
+        if character == '$' and index + 1 < len(text):
+            current += text[index + 1]
+            index += 2
+            continue
+        if character == ' ':
+            if current:
+                tokens.append(current)
+            current = ""
+        else:
+            current += character
+        index += 1
+    if current:
+        tokens.append(current)
+    return tokens
+
+
+def read_build_statements(ninja_file, statements=None):
+    statements = statements if statements is not None else {}
+    if not ninja_file.exists():
+        return statements
+
+    text = re.sub(r"\$\r?\n\s*", "", ninja_file.read_text(errors="replace"))
+    for line in text.splitlines():
+        if line.startswith(("include ", "subninja ")):
+            read_build_statements(ninja_file.parent / line.split(' ', 1)[1].strip(), statements)
+            continue
+        if not line.startswith("build "):
+            continue
+        escaped_colon = line.replace("$:", "\0")
+        outputs_part, _, rest = escaped_colon[len("build "):].partition(':')
+        outputs = [o.replace("\0", ':') for o in _split_unescaped(outputs_part.replace('|', ' '))]
+        tokens = [t.replace("\0", ':') for t in _split_unescaped(rest)]
+        if not tokens:
+            continue
+        rule, inputs = tokens[0], [t for t in tokens[1:] if t not in ('|', '||', '|@')]
+        for output in outputs:
+            statements[output] = (rule, inputs)
+    return statements
+
+
+def attribute_target(edge):
+    if edge.rule:
+        match = rule_target.match(edge.rule)
+        if match:
+            return match.group(1)
+    for output in edge.outputs:
+        match = object_target.search(output)
+        if match:
+            return match.group(1)
+    return Path(edge.outputs[0]).name
+
+
+def critical_path(edges, statements):
+    producers = {output: edge for edge in edges for output in edge.outputs}
+    longest = {}
+    passed = {}
+
+    def resolve(output, visiting):
+        # phony and unlogged outputs cost nothing but still carry their inputs' chains
+        edge = producers.get(output)
+        if edge is not None:
+            return chain(edge, visiting)
+        if output in passed:
+            return passed[output]
+        if output in visiting or output not in statements:
+            return 0, []
+        visiting.add(output)
+        passed[output] = max((resolve(i, visiting) for i in statements[output][1]), key=lambda r: r[0], default=(0, []))
+        visiting.discard(output)
+        return passed[output]
+
+    def chain(edge, visiting):
+        if id(edge) in longest:
+            return longest[id(edge)]
+        visiting.add(edge.outputs[0])
+        inputs = [i for i in edge.inputs if i not in visiting]
+        before = max((resolve(i, visiting) for i in inputs), key=lambda r: r[0], default=(0, []))
+        visiting.discard(edge.outputs[0])
+        longest[id(edge)] = (before[0] + edge.duration, before[1] + [edge])
+        return longest[id(edge)]
+
+    return max((chain(edge, set()) for edge in edges), key=lambda r: r[0], default=(0, []))
+
+
+def parallelism_timeline(edges):
+    if not edges:
+        return 0, []
+    start = min(edge.start for edge in edges)
+    wall = max(edge.end for edge in edges) - start
+    bucket = max(1, wall / timeline_buckets)
+    busy = [0.0] * timeline_buckets
+    for edge in edges:
+        for index in range(timeline_buckets):
+            low, high = start + index * bucket, start + (index + 1) * bucket
+            overlap = min(high, edge.end) - max(low, edge.start)
+            if overlap > 0:
+                busy[index] += overlap / bucket
+    return wall, busy
+
+
+def assign_lanes(edges):
+    lanes = []
+    placement = {}
+    for edge in sorted(edges, key=lambda e: e.start):
+        for lane, free_at in enumerate(lanes):
+            if free_at <= edge.start:
+                lanes[lane] = edge.end
+                placement[id(edge)] = lane
+                break
+        else:
+            placement[id(edge)] = len(lanes)
+            lanes.append(edge.end)
+    return placement
+
+
+def write_chrome_trace(edges, timeline, trace_path):
+    lanes = assign_lanes(edges)
+    events = [{"name": edge.outputs[0], "cat": edge.target, "ph": "X", "pid": 0, "tid": lanes[id(edge)],
+        "ts": edge.start * 1000, "dur": edge.duration * 1000,
+        "args": {"target": edge.target, "rule": edge.rule, "outputs": edge.outputs}} for edge in edges]
+    start = min((edge.start for edge in edges), default=0)
+    wall, busy = timeline
+    bucket = wall / len(busy) if busy else 0
+    events += [{"name": "parallelism", "ph": "C", "pid": 0, "ts": (start + index * bucket) * 1000,
+        "args": {"running": round(value, 2)}} for index, value in enumerate(busy)]
+    trace_path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+
+
+def format_seconds(milliseconds):
+    return "{:8.2f}s".format(milliseconds / 1000)
+
+
+def is_link_step(edge):
+    return bool(edge.rule) and "LINKER" in edge.rule
+
+
+def is_compile_step(edge):
+    return bool(edge.rule) and "COMPILER" in edge.rule or edge.outputs[0].endswith((".o", ".obj"))
+
+
+def write_summary(edges, path_length, path_edges, timeline, summary_path, build_dir):
+    wall, busy = timeline
+    total = sum(edge.duration for edge in edges)
+    lines = ["Build report for " + str(build_dir), ""]
+    lines.append("Wall time:           " + format_seconds(wall))
+    lines.append("Summed edge time:    " + format_seconds(total))
+    lines.append("Average parallelism: {:8.2f}".format(total / wall if wall else 0))
+    lines.append("Critical path:       " + format_seconds(path_length))
+
+    per_target = {}
+    for edge in edges:
+        per_target[edge.target] = per_target.get(edge.target, 0) + edge.duration
+    sections = [
+        ("Slowest targets (summed time)", sorted(per_target.items(), key=lambda item: -item[1])),
+        ("Slowest translation units", sorted(((e.outputs[0], e.duration) for e in edges if is_compile_step(e)), key=lambda item: -item[1])),
+        ("Slowest link steps", sorted(((e.outputs[0], e.duration) for e in edges if is_link_step(e)), key=lambda item: -item[1])),
+    ]
+    for title, rows in sections:
+        lines += ["", title + ':']
+        lines += ["  " + format_seconds(duration) + "  " + name for name, duration in rows[:slowest_count]]
+
+    lines += ["", "Critical path edges:"]
+    lines += ["  " + format_seconds(edge.duration) + "  [" + edge.target + "] " + edge.outputs[0] for edge in path_edges]
+
+    peak = max(busy, default=0) or 1
+    lines += ["", "Parallelism over time (each row is {:.0f} ms of wall time):".format(wall / len(busy))]
+    lines += ["  {:6.2f} {}".format(value, '#' * int(round(50 * value / peak))) for value in busy]
+
+    summary_path.write_text('\n'.join(lines) + '\n')
+    return lines
+
+
+def belongs_to_config(edge, config):
+    if edge.rule:
+        return edge.rule.endswith('_' + config)
+    return any("/{}/".format(config) in '/' + output for output in edge.outputs)
+
+
+def report_ninja_build(build_dir, report_dir, name, multi_config=False):
+    log_path = build_dir / ".ninja_log"
+    if not log_path.exists():
+        print(red_text("No .ninja_log in {}".format(str(build_dir))) + "\nThe report requires use_ninja = true and a finished build")
+        return False
+
+    edges = read_ninja_log(log_path)
+    if not edges:
+        print(yellow_text("Empty .ninja_log in {}".format(str(build_dir))) + ", nothing was built")
+        return False
+
+    statements = read_build_statements(build_dir / "build.ninja")
+    for edge in edges:
+        rule, inputs = statements.get(edge.outputs[0], (None, []))
+        edge.rule = rule
+        edge.inputs = inputs
+        edge.target = attribute_target(edge)
+
+    if multi_config:
+        # every config of a multi-config tree shares one log
+        edges = [edge for edge in edges if belongs_to_config(edge, name)]
+
+    path_length, path_edges = critical_path(edges, statements)
+    timeline = parallelism_timeline(edges)
+
+    report_dir.mkdir(parents=True, exist_ok=True)
+    trace_path = report_dir / (name + "-trace.json")
+    summary_path = report_dir / (name + "-summary.txt")
+    write_chrome_trace(edges, timeline, trace_path)
+    lines = write_summary(edges, path_length, path_edges, timeline, summary_path, build_dir)
+
+    print('\n'.join(lines[:6]))
+    print("Summary:      " + blue_text(str(summary_path)))
+    print("Chrome trace: " + green_text(str(trace_path)) + " (open in chrome://tracing or ui.perfetto.dev)")
+    return True
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+
+from _paths import config_file, noop_index
+from _text_colors import green_text
+
+
+skipped_directories = {"build", "target", ".git", ".tools", ".venv", "__pycache__"}
+# objects and cargo's bookkeeping are intermediates, the artifacts around them are what a build delivers
+intermediate_directories = {"CMakeFiles", ".fingerprint", "incremental"}
+tracked_environment = ("PATH", "CC", "CXX", "CFLAGS", "CXXFLAGS", "LDFLAGS", "RUSTFLAGS", "CARGO_BUILD_TARGET")
+
+# captured on import, before the build itself primes the environment
+launch_environment = {name: os.environ.get(name, "") for name in tracked_environment}
+
+
+def _walk(root, digest):
+    # os.scandir keeps the stat calls cheap, nothing else is touched on the fast path
+    try:
+        entries = sorted(os.scandir(root), key=lambda entry: entry.name)
+    except OSError:
+        digest.update(b"missing " + root.encode())
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            if entry.name not in skipped_directories and not entry.name.startswith('.'):
+                _walk(entry.path, digest)
+        elif entry.is_file():
+            status = entry.stat()
+            digest.update("{}\0{}\0{}\n".format(entry.path, status.st_mtime_ns, status.st_size).encode())
+
+
+def digest_tree(root):
+    digest = hashlib.sha256()
+    _walk(str(root), digest)
+    return digest.hexdigest()
+
+
+def snapshot_inputs(roots):
+    digest = hashlib.sha256()
+    digest.update(config_file.read_bytes() if config_file.exists() else b"")
+    for name in tracked_environment:
+        digest.update("{}={}\n".format(name, launch_environment[name]).encode())
+    for root in roots:
+        _walk(str(root), digest)
+    return digest.hexdigest()
+
+
+def _stat_directory(directory, excluded, outputs):
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            if entry.name not in intermediate_directories and entry.name not in excluded:
+                _stat_directory(entry.path, excluded, outputs)
+        elif entry.is_file():
+            status = entry.stat()
+            outputs[entry.path] = [status.st_mtime_ns, status.st_size]
+
+
+def _stat_outputs(directories, excluded):
+    # artifacts usually live in subdirectories of the build tree, a deleted or replaced one anywhere must be rebuilt
+    outputs = {}
+    for directory in directories:
+        _stat_directory(directory, set(excluded), outputs)
+    return outputs
+
+
+def _index_path(build_type):
+    return noop_index / (build_type + ".json")
+
+
+def invalidate(build_type=None):
+    for index in ([_index_path(build_type)] if build_type else noop_index.glob("*.json")):
+        index.unlink(missing_ok=True)
+
+
+def record_success(build_type, roots, inputs, output_directories, excluded=()):
+    from _toolchain import get_tool_identities
+    noop_index.mkdir(parents=True, exist_ok=True)
+    output_directories = [str(directory) for directory in output_directories]
+    index = {"roots": [str(root) for root in roots], "inputs": inputs, "output_directories": output_directories,
+        "excluded": sorted(excluded), "outputs": _stat_outputs(output_directories, excluded), "tools": get_tool_identities()}
+    _index_path(build_type).write_text(json.dumps(index))
+
+
+def is_up_to_date(build_type):
+    index_path = _index_path(build_type)
+    if not index_path.exists():
+        return False
+    try:
+        index = json.loads(index_path.read_text())
+    except ValueError:
+        return False
+    if not index["outputs"] or _stat_outputs(index["output_directories"], index.get("excluded", ())) != index["outputs"]:
+        return False
+    if snapshot_inputs(index["roots"]) != index["inputs"]:
+        return False
+    from _toolchain import tools_unchanged
+    return tools_unchanged(index.get("tools", {}))
+
+
+def requested_config(arguments):
+    # only a plain rebuild or an explicit --config qualifies, any other flag asks for real work
+    if not arguments:
+        from _build_history import last_used_config
+        return last_used_config()
+    if len(arguments) == 1 and arguments[0].startswith("--config="):
+        return arguments[0].split('=', 1)[1]
+    if len(arguments) == 2 and arguments[0] == "--config":
+        return arguments[1]
+    return None
+
+
+def try_fast_path(arguments):
+    if os.environ.get("TOOLING_NO_FAST_PATH"):
+        return False
+    build_type = requested_config(arguments)
+    if build_type not in ("Debug", "Release") or not is_up_to_date(build_type):
+        return False
+    print(green_text(build_type + " is up to date") + ", nothing changed since its last successful build")
+    return True
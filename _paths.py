@@ -7,6 +7,20 @@ tooling_path = main_project / ".tools"
 venv_path    = main_project / ".venv"
 venv_python  = venv_path / ("Scripts/python.exe" if sys.platform == "win32" else "bin/python")
 requirements = main_project / "requirements.txt"
+pip_stamp    = main_project / ".tools" / "requirements.stamp"
 config_file  = main_project / "project_config.toml"
 profiles_dir = main_project / "tooling" / "conan_profiles"
 last_used    = main_project / ".tools" / "last_built_config.txt"
+history      = main_project / ".tools" / "build_history.jsonl"
+test_times   = main_project / ".tools" / "test_durations.json"
+test_cache   = main_project / ".tools" / "test_cache"
+configured   = main_project / ".tools" / "configure"
+conan_cache  = main_project / ".tools" / "conan_cache"
+reports_dir  = main_project / ".tools" / "reports"
+noop_index   = main_project / ".tools" / "noop"
+trash_dir    = main_project / ".tools" / "trash"
+compile_db   = main_project / "compile_commands.json"
+warmup_stamp = main_project / ".tools" / "clangd_warmup.json"
+toolchain    = main_project / ".tools" / "toolchain.json"
+bench_base   = main_project / ".tools" / "benchmark_baseline.json"
+traces_dir   = main_project / ".tools" / "traces"
@@ -3,8 +3,12 @@ from pathlib import Path
 import os
 import subprocess
 import shutil
+import signal
+from contextlib import contextmanager
 
 from _text_colors import red_text, yellow_text, green_text
+from _scheduler import run_command
+from _tracing import traced, traced_run, traced_popen
 
 
 def prime_python(venv_python_path):
@@ -42,6 +46,7 @@ def get_lldb_hint():
         sys.exit(1)
 
 
+@traced("prime_environment")
 def prime_environment(compiler):
     windows_specific_compiler = compiler == "msvc" or compiler == "clang-cl"
     if sys.platform != "win32":
@@ -57,14 +62,14 @@ def prime_environment(compiler):
             print(yellow_text("No Visual Studio installation found") + " make sure you have a copy of Visual Studio to use " + compiler)
         return
 
-    vs_path = subprocess.run([str(vswhere), "-property", "installationPath"], capture_output=True, text=True)
+    vs_path = traced_run([str(vswhere), "-property", "installationPath"], capture_output=True, text=True)
     activator_path = Path(vs_path.stdout.strip()).resolve() / "VC" / "Auxiliary" / "Build" / "vcvars64.bat"
     if not activator_path.exists():
         if windows_specific_compiler:
             print(yellow_text("Could not activate vcvars64.bat to use ") + compiler)
         return
 
-    msv_updates = subprocess.run(["cmd.exe", "/c", str(activator_path), "&&", "set"], capture_output=True, text=True)
+    msv_updates = traced_run(["cmd.exe", "/c", str(activator_path), "&&", "set"], capture_output=True, text=True)
     for line in msv_updates.stdout.split('\n'):
         if '=' in line:
             key, value = line.split('=', 1)
@@ -100,7 +105,7 @@ def windows_proof_cargo_target(rust_directory, compiler, use_ninja):
         return None
 
     target = "x86_64-pc-windows-gnu"
-    result = subprocess.run(["rustup", "target", "list", "--installed"], cwd=str(rust_directory), stdout=subprocess.PIPE, text=True)
+    result = traced_run(["rustup", "target", "list", "--installed"], cwd=str(rust_directory), stdout=subprocess.PIPE, text=True)
     if target not in result.stdout:
         print(yellow_text(target + " is not installed, using default target, possible ABI incompatibility"))
         print("To enable " + target + " run " + green_text("rustup target add " + target) + " from " + str(rust_directory))
@@ -111,11 +116,11 @@ def windows_proof_cargo_target(rust_directory, compiler, use_ninja):
 
 def try_build(build_command, cmake_directory, attempts):
     if attempts == 1 or sys.platform != "win32":
-        result = subprocess.run(build_command, cwd=str(cmake_directory))
+        result = run_command(build_command, cmake_directory)
         return result.returncode == 0
 
     while True:
-        result = subprocess.run(build_command, cwd=str(cmake_directory), stdout=subprocess.PIPE, text=True)
+        result = run_command(build_command, cmake_directory, capture=True)
         attempts -= 1
 
         if "ninja: error: failed recompaction: Permission denied" in result.stdout and attempts > 0:
@@ -134,3 +139,100 @@ def print_compiler_warning(compiler, windows_generator):
     if compiler != "clang-cl" and compiler != "msvc":
         print(yellow_text("MSVC Generator ignores {}".format(compiler)) + "\nCompatible compilers: msvc or clang-cl")
         print("If you need {}, try to use ".format(compiler) + green_text("ninja") + " instead\n")
+
+
+def start_process_tree(command, cwd):
+    if sys.platform == "win32":
+        return traced_popen(command, cwd=str(cwd), creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+    return traced_popen(command, cwd=str(cwd), start_new_session=True)
+
+
+def terminate_process_tree(process):
+    if process.poll() is not None:
+        return
+    if sys.platform == "win32":
+        traced_run(["taskkill", "/F", "/T", "/PID", str(process.pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    process.wait()
+
+
+def start_detached(command, cwd):
+    if sys.platform == "win32":
+        flags = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+        return traced_popen(command, cwd=str(cwd), creationflags=flags,
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return traced_popen(command, cwd=str(cwd), start_new_session=True,
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def get_memory():
+    # total and currently available physical memory in bytes, containers report their cgroup limit
+    if sys.platform == "win32":
+        import ctypes
+
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(MemoryStatus)
+        ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status))
+        return status.ullTotalPhys, status.ullAvailPhys
+
+    if sys.platform == "darwin":
+        result = traced_run(["sysctl", "-n", "hw.memsize"], capture_output=True, text=True)
+        total = int(result.stdout.strip() or 0)
+        # macOS gives memory back from its caches on demand, so the total is the best estimate
+        return total, total
+
+    meminfo = {}
+    with open("/proc/meminfo") as source:
+        for line in source:
+            name, _, value = line.partition(':')
+            meminfo[name] = int(value.split()[0]) * 1024
+    total, available = meminfo["MemTotal"], meminfo.get("MemAvailable", meminfo["MemFree"])
+    for limit_file, usage_file in (("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+            ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes")):
+        try:
+            limit = int(Path(limit_file).read_text())
+            usage = int(Path(usage_file).read_text())
+        except (OSError, ValueError):
+            continue
+        if limit < total:
+            total, available = limit, min(available, limit - usage)
+        break
+    return total, available
+
+
+@contextmanager
+def exclusive_lock(lock_path):
+    # serializes a section across processes, e.g. conan installs of concurrent --matrix builds
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(str(lock_path), "a+b") as lock_file:
+        if sys.platform == "win32":
+            import msvcrt
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
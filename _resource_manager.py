@@ -1,20 +1,39 @@
 from pathlib import Path
+import json
+import os
+import platform
 import shutil
 import sys
 import tomllib
-import subprocess
 from _platform_specific import get_profile_path, windows_proof_cmake_preset, windows_proof_cargo_target
 from _platform_specific import try_build, print_compiler_warning
 from _text_colors import blue_text, green_text, red_text, yellow_text
-from _paths import script_dir, profiles_dir, main_project, config_file, last_used
+from _paths import script_dir, profiles_dir, main_project, config_file
+from _fingerprint import collect_files, is_cmake_input, profile_contents, fingerprint_files, hash_values
+from _conan_cache import get_conan_version
+from _compiler_cache import configure_compiler_cache, get_launcher_flags
+from _artifact_cache import configure_artifact_store
+from _job_budget import configure_job_budget, get_job_pool_flags, get_tool_parallelism, uses_jobserver
+from _build_history import last_used_config, last_used_variant
+from _tracing import span, traced
+from _toolchain import find_tool, get_version, get_version_output, get_target_triple, get_profile_mismatch
 
 
 config_contents = None
+resolved_profiles = {}
 
 # CMake
 compiler = ""
 use_ninja = False
 shared_libs = False
+multi_config = False
+build_variant = None
+unity_build = False
+unity_batch_size = 8
+precompile_headers = []
+acceleration_exclude = []
+link_profile = "default"
+fast_linker = None
 
 # Rust
 targets = None
@@ -28,19 +47,32 @@ def get_compiler():
     return compiler
 
 
+@traced("get_conan_profile")
 def get_conan_profile():
     profile_name = compiler + ("_ninja" if use_ninja else "_default")
+    if profile_name in resolved_profiles:
+        return resolved_profiles[profile_name]
     profile_path = get_profile_path(profiles_dir, profile_name)
 
     if profile_path.resolve().exists():
         print("Conan profile:\t\t{}".format(str(profile_path)))
-        return str(profile_path.resolve())
+        resolved_profiles[profile_name] = str(profile_path.resolve())
+        return resolved_profiles[profile_name]
     else:
         print(red_text("Conan profile does not exist: ") + str(profile_path))
         print("Make sure {} contains valid compiler value in cmake section".format(str(config_file)))
         sys.exit(1)
 
 
+def verify_profile_compiler(profile, tool):
+    # conan would happily build every dependency for the pinned version first
+    mismatch = get_profile_mismatch(Path(profile), tool)
+    if mismatch:
+        print(red_text("{} {} is installed, but the conan profile pins compiler.version={}".format(tool, mismatch[1], mismatch[0])))
+        print("Update compiler.version under " + str(profiles_dir / "components") + " or install the pinned compiler")
+        sys.exit(1)
+
+
 def resolve_resource(file_name, additional_text=""):
     expected = main_project / file_name
     fallback = script_dir / file_name
@@ -53,11 +85,13 @@ def resolve_resource(file_name, additional_text=""):
 
 
 def check_presence(tool, required=True):
-    if shutil.which(tool) is None and required:
-        print(red_text("Failed to find {}. Can not proceed".format(tool)))
-        print("Make sure to run " + green_text("just setup") + " and properly activate your shell")
-        sys.exit(1)
-    return shutil.which(tool) is not None
+    with span("check_presence", tool=tool):
+        found = find_tool(tool) is not None
+        if not found and required:
+            print(red_text("Failed to find {}. Can not proceed".format(tool)))
+            print("Make sure to run " + green_text("just setup") + " and properly activate your shell")
+            sys.exit(1)
+        return found
 
 
 def get_verified_path(section):
@@ -83,6 +117,7 @@ def get_verified_path(section):
     return path
 
 
+@traced("load_config")
 def load_config(section, warn=False):
     global config_contents
     if not config_contents:
@@ -91,6 +126,10 @@ def load_config(section, warn=False):
             sys.exit(1)
         print("Reading configuration from " + blue_text(str(config_file.parent.name) + '/' + str(config_file.name)))
         config_contents = tomllib.loads(config_file.read_text())
+        matrix_entry = os.environ.get("TOOLING_MATRIX_ENTRY")
+        if matrix_entry:
+            # a --matrix child builds one combination, which overrides the cmake section
+            config_contents.setdefault("cmake", {}).update(json.loads(matrix_entry))
 
     section_config = config_contents.get(section)
     if not section_config and warn:
@@ -100,22 +139,38 @@ def load_config(section, warn=False):
 
 
 def get_last_used_config():
-    if not last_used.exists():
-        return None
-    config = last_used.read_text()
-    if config != "Debug" and config != "Release":
-        print(red_text("Broken {}".format(str(config))) + "\nRemoving it and building from scratch")
-        last_used.unlink()
-        return None
-    return config
+    return last_used_config()
+
+
+def get_last_used_variant():
+    return last_used_variant()
+
+
+def is_matrix_build():
+    return bool(os.environ.get("TOOLING_MATRIX_ENTRY"))
+
+
+def format_variant(variant_compiler, variant_ninja, variant_shared, variant_multi_config=False, variant_unity=False, variant_pch=False,
+        variant_fast_link=False):
+    generator = "ninja-multi" if variant_multi_config and variant_ninja else "ninja" if variant_ninja else "default"
+    return "{}-{}-{}{}{}{}".format(variant_compiler, generator, "shared" if variant_shared else "static",
+        "-unity" if variant_unity else "", "-pch" if variant_pch else "", "-fastlink" if variant_fast_link else "")
+
+
+def get_variant_name():
+    return format_variant(compiler, use_ninja, shared_libs, multi_config, unity_build, bool(precompile_headers), uses_fast_link())
 
 
-def set_last_used_config(build_type):
-    if build_type is not None:
-        last_used.write_text(build_type)
-    elif last_used.exists():
-        print("Wiping the last used build configuration")
-        last_used.unlink()
+def uses_fast_link():
+    # split DWARF and thin archives are ELF features, msvc and macOS keep their defaults
+    return link_profile == "fast" and sys.platform == "linux" and compiler in ("gcc", "clang")
+
+
+def find_fast_linker():
+    if find_tool("mold") and (find_tool("gcc") is None or get_version("gcc") >= (12, 1)):
+        # gcc understands -fuse-ld=mold since 12.1, cargo links through it as well
+        return "mold"
+    return "lld" if find_tool("ld.lld") else None
 
 
 def get_conanfile(cmake_directory):
@@ -126,18 +181,86 @@ def get_conanfile(cmake_directory):
     return result if result.exists() else None
 
 
-def get_generate_command(cmake_directory, build_type):
-    build_dir = cmake_directory / "build" / build_type
-    print("CMake build directory:\t{}".format(str(build_dir)))
+def uses_ninja():
+    return use_ninja
+
+
+def is_multi_config():
+    return multi_config
 
-    result = []
 
+def get_configuration_types(build_type):
+    return ["Release", "Debug"] if multi_config else [build_type]
+
+
+def get_build_dir(cmake_directory, build_type):
+    build_root = cmake_directory / "build"
+    if build_variant:
+        build_root /= build_variant
+    if not multi_config:
+        return build_root / build_type
+    # conan's cmake_layout puts a multi-config tree directly into build/<variant>
+    return build_root if get_conanfile(cmake_directory) else build_root / "multi"
+
+
+def get_compiler_commands():
     c_compiler = compiler if compiler != "msvc" else "cl"
     cpp_compiler = compiler
     match compiler:
         case "gcc": cpp_compiler = "g++"
         case "clang": cpp_compiler = "clang++"
         case _: cpp_compiler = c_compiler
+    return c_compiler, cpp_compiler
+
+
+def get_configure_fingerprint(cmake_directory, build_type, commands):
+    inputs = collect_files(cmake_directory, is_cmake_input)
+    conanfile = get_conanfile(cmake_directory)
+    profile = None
+    if conanfile:
+        inputs.append(conanfile)
+        # conan writes the toolchain and presets the configure step consumes
+        inputs += sorted((get_build_dir(cmake_directory, build_type) / "generators").glob("*"))
+        inputs.append(cmake_directory / "CMakeUserPresets.json")
+        profile = profile_contents(get_conan_profile())
+
+    digest = fingerprint_files(inputs)
+    settings = {section: load_config(section) for section in ("cmake", "migration", "cache")}
+    compiler_paths = [find_tool(tool) for tool in get_compiler_commands()]
+    return hash_values(digest.hexdigest(), profile, settings, compiler_paths, commands)
+
+
+def get_conan_cache_key(cmake_directory, build_type, generate_command):
+    conanfile = get_conanfile(cmake_directory)
+    build_dir = get_build_dir(cmake_directory, build_type).resolve()
+    return hash_values(conanfile.name, conanfile.read_text(), profile_contents(get_conan_profile()), build_type,
+        get_conan_version(), str(build_dir), generate_command)
+
+
+def get_toolchain_fingerprint(language):
+    compilers = list(get_compiler_commands()) if language == "cmake" else ["rustc"]
+    tools = compilers + (["cmake"] + (["ninja"] if use_ninja else []) if language == "cmake" else ["cargo"])
+    return [[tool, find_tool(tool), get_version_output(tool), get_target_triple(tool) if tool in compilers else None] for tool in tools]
+
+
+def get_artifact_key(language, directory, build_type):
+    # the sources are hashed by content and their place in the project, the store relocates restored trees to the checkout
+    sources = fingerprint_files(collect_files(directory, lambda name: True), root=main_project.resolve())
+    conanfile = get_conanfile(directory) if language == "cmake" else None
+    profile = profile_contents(get_conan_profile()) if conanfile else None
+    settings = {section: load_config(section) for section in ("cmake", "rust", "migration")}
+    cargo_target = windows_proof_cargo_target(directory, compiler, use_ninja) if language == "rust" else None
+    return hash_values(language, build_type, sources.hexdigest(), get_toolchain_fingerprint(language), profile,
+        shared_libs, features, cargo_target, settings, sys.platform, platform.machine())
+
+
+def get_generate_command(cmake_directory, build_type):
+    build_dir = get_build_dir(cmake_directory, build_type)
+    print("CMake build directory:\t{}".format(str(build_dir)))
+
+    result = []
+
+    c_compiler, cpp_compiler = get_compiler_commands()
 
     check_presence(c_compiler)
     check_presence(cpp_compiler)
@@ -148,12 +271,22 @@ def get_generate_command(cmake_directory, build_type):
     if conanfile:
         check_presence("conan")
         conan_profile = get_conan_profile()
+        verify_profile_compiler(conan_profile, cpp_compiler)
         result += ["conan", "install", ".", "--build=missing", "--profile", conan_profile, "--settings", "build_type={}".format(build_type)]
+        if multi_config:
+            result += ["--conf", "tools.cmake.cmaketoolchain:generator=Ninja Multi-Config"]
+        if build_variant:
+            # cmake_layout then nests the build folder and names the presets after the variant
+            result += ["--conf", "tools.cmake.cmake_layout:build_folder_vars=['const.{}']".format(build_variant)]
     else:
-        result += ["cmake", "-DCMAKE_BUILD_TYPE:STRING={}".format(build_type), "-DCMAKE_EXPORT_COMPILE_COMMANDS:BOOL=TRUE",
+        if multi_config:
+            build_type_setting = "-DCMAKE_CONFIGURATION_TYPES:STRING={}".format(';'.join(get_configuration_types(build_type)))
+        else:
+            build_type_setting = "-DCMAKE_BUILD_TYPE:STRING={}".format(build_type)
+        result += ["cmake", build_type_setting, "-DCMAKE_EXPORT_COMPILE_COMMANDS:BOOL=TRUE",
             "--no-warn-unused-cli", "-S", ".", "-B", str(build_dir)]
         if use_ninja:
-            result += ["-G", "Ninja"]
+            result += ["-G", "Ninja Multi-Config" if multi_config else "Ninja"]
         else:
             if compiler == "clang-cl":
                 result += ["-T", "ClangCL"]
@@ -164,25 +297,58 @@ def get_generate_command(cmake_directory, build_type):
         if shared_libs:
             result += ["-DBUILD_SHARED_LIBS=ON"]
         result += ["-DCMAKE_C_COMPILER={}".format(c_compiler), "-DCMAKE_CXX_COMPILER={}".format(cpp_compiler)]
+        result += get_launcher_flags()
+        result += get_acceleration_flags(cmake_directory)
+        if use_ninja:
+            result += get_job_pool_flags()
         print_compiler_warning(compiler, not use_ninja)
 
     return result
 
 
+def get_acceleration_flags(cmake_directory):
+    # every value is passed, so turning an option off also resets what the CMake cache remembered
+    flags = ["-DCMAKE_UNITY_BUILD:BOOL={}".format("ON" if unity_build else "OFF")]
+    if unity_build:
+        flags.append("-DCMAKE_UNITY_BUILD_BATCH_SIZE:STRING={}".format(unity_batch_size))
+    if not precompile_headers and not (unity_build and acceleration_exclude) and not uses_fast_link():
+        return flags + ["-UCMAKE_PROJECT_INCLUDE"]
+    # system headers stay in angle brackets, project headers are relative to the cmake path
+    headers = [header if header.startswith('<') else (cmake_directory / header).resolve().as_posix() for header in precompile_headers]
+    return flags + ["-DCMAKE_PROJECT_INCLUDE:FILEPATH={}".format((script_dir / "accelerate.cmake").as_posix()),
+        "-DTOOLING_PRECOMPILE_HEADERS:STRING={}".format(';'.join(headers)),
+        "-DTOOLING_ACCELERATION_EXCLUDE:STRING={}".format(';'.join(acceleration_exclude)),
+        "-DTOOLING_FAST_LINK:BOOL={}".format("ON" if uses_fast_link() else "OFF"),
+        "-DTOOLING_FAST_LINKER:STRING={}".format(fast_linker or "")]
+
+
+def get_cargo_link_arguments(rust_directory):
+    if link_profile != "fast" or sys.platform != "linux":
+        return []
+    arguments = ["--config", 'profile.dev.split-debuginfo="unpacked"']
+    if fast_linker:
+        triple = get_cargo_target(rust_directory) or get_target_triple("rustc")
+        arguments += ["--config", 'target.{}.rustflags=["-C", "link-arg=-fuse-ld={}"]'.format(triple, fast_linker)]
+    return arguments
+
+
 def get_build_command(cmake_directory, build_type):
-    build_dir = cmake_directory / "build" / build_type
+    build_dir = get_build_dir(cmake_directory, build_type)
     print("Building {} CMake in {}".format(build_type, str(build_dir)))
 
     build_command = ["cmake", "--build"]
 
     conanfile = get_conanfile(cmake_directory)
     if conanfile:
-        cmake_preset = get_cmake_preset_name(build_type)
-        subprocess.run(["cmake", "--preset", cmake_preset], cwd=str(cmake_directory), check=True)
-        build_command += ["--preset", "conan-debug" if build_type == "Debug" else "conan-release"]
+        build_command += ["--preset", get_variant_preset_name("conan-debug" if build_type == "Debug" else "conan-release")]
     else:
         build_command += [str(build_dir), "--config", build_type]
 
+    # tools outside of the shared jobserver get their share of the budget explicitly
+    parallelism = get_tool_parallelism()
+    if parallelism and not uses_jobserver(use_ninja):
+        build_command += ["--parallel", str(parallelism)]
+
     if targets:
         build_command.append("--target")
         build_command += targets
@@ -190,8 +356,23 @@ def get_build_command(cmake_directory, build_type):
     return build_command
 
 
+def set_targets(affected_targets):
+    global targets
+    targets = affected_targets
+
+
+def get_preset_command(cmake_directory, build_type):
+    # conan projects are configured from the presets generated by conan install
+    if not get_conanfile(cmake_directory):
+        return None
+    return ["cmake", "--preset", get_cmake_preset_name(build_type)] + get_launcher_flags() + get_acceleration_flags(cmake_directory) + \
+        (get_job_pool_flags() if use_ninja else [])
+
+
+@traced("config load")
 def update_project_config():
-    global compiler, use_ninja, shared_libs, targets, features, legacy_build
+    global compiler, use_ninja, shared_libs, multi_config, targets, features, legacy_build, build_variant
+    global unity_build, unity_batch_size, precompile_headers, acceleration_exclude, link_profile, fast_linker
     migration_config = load_config("migration")
     if not migration_config:
         print(yellow_text("No [migration] section in project_config.toml") +
@@ -208,7 +389,33 @@ def update_project_config():
             compiler = "clang"
         use_ninja   = cmake_config.get("use_ninja", False)
         shared_libs = cmake_config.get("shared_libs", False)
+        multi_config = cmake_config.get("multi_config", False)
+        if multi_config and not use_ninja:
+            print(yellow_text("multi_config requires use_ninja") + ", building separate trees per config")
+            multi_config = False
         targets     = cmake_config.get("targets", ["all"])
+        unity_build = cmake_config.get("unity_build", False)
+        unity_batch_size = cmake_config.get("unity_batch_size", 8)
+        precompile_headers = cmake_config.get("precompile_headers", [])
+        acceleration_exclude = cmake_config.get("acceleration_exclude", [])
+        link_profile = cmake_config.get("link_profile", "default")
+        if link_profile not in ("default", "fast"):
+            print(yellow_text("Unknown link_profile {}".format(link_profile)) + ", expected default or fast")
+            link_profile = "default"
+        if link_profile == "fast" and sys.platform != "linux":
+            print(yellow_text("link_profile fast only applies to Linux") + ", linking with the defaults")
+        elif link_profile == "fast":
+            fast_linker = find_fast_linker()
+            if fast_linker:
+                print("Link profile:\t\t" + green_text("fast") + " with {}, split DWARF and thin archives".format(fast_linker))
+            else:
+                print(yellow_text("Neither mold nor lld found") + ", the fast link profile keeps the default linker")
+        # every toolchain and option set builds into a tree of its own, so switching between them keeps each one warm
+        build_variant = get_variant_name()
+
+    configure_compiler_cache(load_config("cache"))
+    configure_artifact_store(load_config("artifacts"))
+    configure_job_budget(load_config("jobs"))
 
     rust_config = load_config("rust", True)
     if rust_config:
@@ -217,8 +424,19 @@ def update_project_config():
             features += ["legacy-build"]
 
 
+def get_variant_preset_name(preset_name):
+    # conan's cmake_layout prefixes the preset names with the build_folder_vars, the multi-config one is named after them alone
+    if not build_variant:
+        return preset_name
+    if preset_name == "conan-default":
+        return "conan-" + build_variant
+    return preset_name.replace("conan-", "conan-{}-".format(build_variant), 1)
+
+
 def get_cmake_preset_name(build_type):
-    return windows_proof_cmake_preset(build_type, use_ninja)
+    if multi_config:
+        return get_variant_preset_name("conan-default")
+    return get_variant_preset_name(windows_proof_cmake_preset(build_type, use_ninja))
 
 
 def build_and_verify(build_command, cmake_directory):
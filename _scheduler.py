@@ -0,0 +1,154 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from _text_colors import blue_text, red_text, yellow_text
+from _tracing import span, command_span, traced_run
+
+
+_local = threading.local()
+# jobserver pipe ends every spawned tool inherits
+inherited_descriptors = ()
+
+
+class Job:
+    def __init__(self, name, action, dependencies=(), config=None):
+        self.name = name
+        self.action = action
+        self.dependencies = list(dependencies)
+        self.config = config
+        self.state = "pending"
+        self.duration = 0.0
+
+
+class _PrefixingStream:
+    # stdout replacement that tags every complete line written by a job thread with the job's name
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        prefix = getattr(_local, "prefix", None)
+        if prefix is None:
+            with self.lock:
+                return self.stream.write(text)
+
+        pending = getattr(_local, "pending", "") + text
+        *lines, _local.pending = pending.split('\n')
+        if lines:
+            with self.lock:
+                for line in lines:
+                    self.stream.write(prefix + line + '\n')
+                self.stream.flush()
+        return len(text)
+
+    def flush_pending(self):
+        if getattr(_local, "pending", ""):
+            self.write('\n')
+
+    def flush(self):
+        with self.lock:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def default_budget():
+    return max(2, (os.cpu_count() or 1) // 8)
+
+
+def run_command(command, cwd, env=None, capture=False, handle_line=None):
+    # inside a job the output is piped and prefixed, otherwise the tool owns the terminal as usual
+    if getattr(_local, "prefix", None) is None and not capture and handle_line is None:
+        return traced_run(command, cwd=str(cwd), env=env, pass_fds=inherited_descriptors)
+
+    with command_span(command, cwd) as details:
+        process = subprocess.Popen(command, cwd=str(cwd), env=env, stdin=subprocess.DEVNULL, pass_fds=inherited_descriptors,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace")
+        captured = []
+        for line in process.stdout:
+            if handle_line:
+                # structured output is consumed as it arrives, only what the handler returns is shown
+                line = handle_line(line)
+                if not line:
+                    continue
+            if capture:
+                captured.append(line)
+            else:
+                sys.stdout.write(line)
+        process.wait()
+        details["exit_code"] = process.returncode
+    return subprocess.CompletedProcess(command, process.returncode, ''.join(captured) if capture else None)
+
+
+def _run_action(job):
+    # a crashing job fails the same way whether it runs alone or in a graph
+    start = time.monotonic()
+    try:
+        with span(job.name):
+            succeeded = bool(job.action())
+    except SystemExit:
+        succeeded = False
+    except Exception as error:
+        print(red_text("{} crashed: {}".format(job.name, error)))
+        succeeded = False
+    job.duration = time.monotonic() - start
+    return succeeded
+
+
+def _execute(job, finished, condition):
+    _local.prefix = blue_text("[{}] ".format(job.name))
+    succeeded = _run_action(job)
+    sys.stdout.flush_pending()
+    _local.prefix = None
+
+    with condition:
+        job.state = "succeeded" if succeeded else "failed"
+        finished.append(job)
+        condition.notify()
+
+
+def run_jobs(jobs, budget=None):
+    budget = max(1, budget or default_budget())
+    if len(jobs) == 1:
+        # nothing to interleave, keep the tool attached to the terminal
+        job = jobs[0]
+        job.state = "succeeded" if _run_action(job) else "failed"
+        return job.state == "succeeded"
+
+    pending = list(jobs)
+    running = 0
+    finished = []
+    condition = threading.Condition()
+    original_stdout = sys.stdout
+    sys.stdout = _PrefixingStream(original_stdout)
+    try:
+        with condition:
+            while pending or running:
+                for job in list(pending):
+                    if any(dependency.state in ("failed", "skipped") for dependency in job.dependencies):
+                        job.state = "skipped"
+                        pending.remove(job)
+                        print(yellow_text("Skipping {}".format(job.name)) + " because its dependency failed")
+                    elif running < budget and all(dependency.state == "succeeded" for dependency in job.dependencies):
+                        job.state = "running"
+                        pending.remove(job)
+                        running += 1
+                        threading.Thread(target=_execute, args=(job, finished, condition), daemon=True).start()
+
+                if running:
+                    condition.wait_for(lambda: finished)
+                    running -= len(finished)
+                    finished.clear()
+                elif pending:
+                    print(red_text("Unsatisfiable dependencies: ") + ', '.join(job.name for job in pending))
+                    for job in pending:
+                        job.state = "skipped"
+                    pending.clear()
+    finally:
+        sys.stdout = original_stdout
+
+    return all(job.state == "succeeded" for job in jobs)
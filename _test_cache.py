@@ -0,0 +1,104 @@
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from _fingerprint import collect_files, hash_file, hash_values
+from _paths import main_project, test_cache
+
+
+cached_environment = ("PATH", "LD_LIBRARY_PATH", "DYLD_LIBRARY_PATH", "RUST_BACKTRACE", "RUST_TEST_THREADS")
+maximal_age = 14 * 24 * 3600  # seconds since the last hit
+
+
+_digests = {}
+_listings = {}
+_lock = threading.Lock()
+
+
+def file_digest(path):
+    # many units share a binary, the libraries of the tree and the data, each file is hashed once per run
+    try:
+        status = os.stat(str(path))
+    except OSError:
+        return None
+    with _lock:
+        entry = _digests.setdefault((str(path), status.st_mtime_ns, status.st_size), [threading.Lock(), None])
+    with entry[0]:
+        if entry[1] is None:
+            entry[1] = hash_file(path).hexdigest()
+    return entry[1]
+
+
+def resolve_executable(command, cwd):
+    path = Path(cwd, command[0])
+    if path.is_file():
+        return path
+    found = shutil.which(command[0])
+    return Path(found) if found else None
+
+
+def command_files(command, cwd):
+    # an interpreter runs the script it is given, every argument naming a file counts like the executable
+    executable = resolve_executable(command, cwd)
+    if executable is None:
+        return None
+    return [executable] + [Path(cwd, argument) for argument in command[1:] if Path(cwd, argument).is_file()]
+
+
+def expand_inputs(paths):
+    files = []
+    for path in paths:
+        if path.is_dir():
+            with _lock:
+                listing = _listings.get(path)
+            if listing is None:
+                listing = collect_files(path, lambda name: True)
+                with _lock:
+                    _listings[path] = listing
+            files += listing
+        else:
+            files.append(path)
+    return files
+
+
+def cache_key(unit, data):
+    # the key covers everything a test is told about: its binary, data, arguments and environment
+    if not unit.cacheable:
+        return None
+    # a ctest unit runs through ctest, the binaries and scripts of the tests it hands over are hashed as well
+    commands = [(unit.command, unit.cwd)] + [(test["command"], test["cwd"]) for test in unit.definition]
+    files = []
+    for command, cwd in commands:
+        named = command_files(command, cwd)
+        if named is None:
+            return None
+        files += named
+    inputs = expand_inputs(unit.inputs + [main_project / path for path in data])
+    return hash_values(unit.name, [(str(path), file_digest(path)) for path in files + inputs],
+        unit.command[1:], str(unit.cwd), unit.environment, {name: os.environ.get(name, "") for name in cached_environment},
+        unit.timeout, unit.will_fail, unit.definition)
+
+
+def is_cached(key):
+    entry = test_cache / key
+    if not entry.exists():
+        return False
+    os.utime(str(entry))
+    return True
+
+
+def record_pass(key, unit):
+    test_cache.mkdir(parents=True, exist_ok=True)
+    (test_cache / key).write_text(json.dumps({"name": unit.name, "time": time.time(), "duration": round(unit.duration, 3)}))
+
+
+def evict_stale_entries():
+    if not test_cache.exists():
+        return
+    threshold = time.time() - maximal_age
+    for entry in test_cache.iterdir():
+        if entry.stat().st_mtime < threshold:
+            entry.unlink()
@@ -0,0 +1,277 @@
+import hashlib
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from _text_colors import blue_text, green_text, red_text, yellow_text
+from _paths import test_times
+from _fingerprint import collect_files
+from _test_cache import cache_key, is_cached, record_pass, evict_stale_entries
+from _tracing import traced_run
+
+
+library_suffixes = (".so", ".dylib", ".dll")
+
+
+class TestUnit:
+    def __init__(self, name, command, cwd, environment=None, timeout=None, will_fail=False, inputs=(), cacheable=True,
+            definition=(), serial=False, locks=()):
+        self.name = name
+        self.command = command
+        self.cwd = cwd
+        self.environment = environment or {}
+        self.timeout = timeout
+        self.will_fail = will_fail
+        self.inputs = list(inputs)
+        self.cacheable = cacheable
+        # the tests a ctest unit hands over to ctest, part of its cache key
+        self.definition = list(definition)
+        self.serial = serial
+        self.locks = sorted(locks)
+        self.status = "pending"
+        self.output = ""
+        self.duration = 0.0
+
+
+def _group_ctests(tests):
+    # tests sharing a fixture or depending on each other run in one ctest call, so ctest orders them and sets the fixtures up once
+    groups = {}
+
+    def find(name):
+        while groups.setdefault(name, name) != name:
+            name = groups[name]
+        return name
+
+    names = {test["name"] for test in tests}
+    for test in tests:
+        properties = test["properties"]
+        for fixture in properties.get("FIXTURES_SETUP", []) + properties.get("FIXTURES_REQUIRED", []) + properties.get("FIXTURES_CLEANUP", []):
+            groups[find(test["name"])] = find("fixture " + fixture)
+        for dependency in properties.get("DEPENDS", []):
+            if dependency in names:
+                groups[find(test["name"])] = find(dependency)
+
+    grouped = {}
+    for test in tests:
+        grouped.setdefault(find(test["name"]), []).append(test)
+    return sorted(grouped.values(), key=lambda members: members[0]["name"])
+
+
+def discover_ctest(build_dir, build_type):
+    listing = traced_run(["ctest", "--test-dir", str(build_dir), "-C", build_type, "--show-only=json-v1"],
+        capture_output=True, text=True)
+    if listing.returncode != 0:
+        print(yellow_text("Could not list ctest suites in " + str(build_dir)) + '\n' + listing.stderr.strip())
+        return []
+
+    tests = []
+    for test in json.loads(listing.stdout).get("tests", []):
+        properties = {item["name"]: item["value"] for item in test.get("properties", [])}
+        # tests missing from this config come without a command
+        if "command" not in test or properties.get("DISABLED"):
+            continue
+        tests.append({"name": test["name"], "command": test["command"], "properties": properties,
+            "cwd": properties.get("WORKING_DIRECTORY", str(build_dir))})
+
+    # a test binary linked against shared libraries of the tree changes behavior along with them
+    libraries = collect_files(build_dir, lambda name: name.endswith(library_suffixes) or ".so." in name)
+    units = []
+    for members in _group_ctests(tests):
+        names = [test["name"] for test in members]
+        name = "ctest " + names[0] + (" (+{} sharing fixtures or dependencies)".format(len(names) - 1) if len(names) > 1 else "")
+        # ctest itself runs them, so regular expressions, skip codes, fixtures and environment changes keep their meaning
+        command = ["ctest", "--test-dir", str(build_dir), "-C", build_type, "--output-on-failure",
+            "-R", "^({})$".format('|'.join(re.escape(name) for name in names))]
+        inputs = [Path(test["cwd"], path) for test in members for path in test["properties"].get("REQUIRED_FILES", [])] + libraries
+        serial = any(test["properties"].get("RUN_SERIAL") for test in members)
+        locks = {lock for test in members for lock in test["properties"].get("RESOURCE_LOCK", [])}
+        units.append(TestUnit(name, command, str(build_dir), inputs=inputs, definition=members, serial=serial, locks=locks))
+    return units
+
+
+def discover_cargo(rust_directory, build_type, target, features, link_arguments=()):
+    # builds the test binaries once, then every binary is a unit of its own
+    command = ["cargo", "test", "--no-run", "--message-format=json"]
+    if build_type == "Release":
+        command.append("--release")
+    if target:
+        command += ["--target", target]
+    if features:
+        command += ["--features", ','.join(features)]
+    # the same link settings as build.py, so the dependencies are not rebuilt for the tests
+    command += list(link_arguments)
+    print("Building Rust tests: " + ' '.join(command))
+    listing = traced_run(command, cwd=str(rust_directory), stdout=subprocess.PIPE, text=True)
+    if listing.returncode != 0:
+        units = [TestUnit("cargo build", command, str(rust_directory), cacheable=False)]
+        units[0].status = "failed"
+        units[0].output = "cargo test --no-run failed"
+        return units
+
+    units = []
+    for line in listing.stdout.splitlines():
+        try:
+            message = json.loads(line)
+        except ValueError:
+            continue
+        if message.get("reason") != "compiler-artifact" or not message.get("executable") or not message["profile"]["test"]:
+            continue
+        manifest_dir = str(Path(message["manifest_path"]).parent)
+        name = "cargo {} ({})".format(message["target"]["name"], ','.join(message["target"]["kind"]))
+        units.append(TestUnit(name, [message["executable"]], manifest_dir, {"CARGO_MANIFEST_DIR": manifest_dir}))
+    return units
+
+
+def parse_shard(text):
+    index, _, count = text.partition('/')
+    if not index.isdigit() or not count.isdigit() or not 1 <= int(index) <= int(count):
+        return None
+    return int(index), int(count)
+
+
+def select_shard(units, index, count):
+    # longest first onto the least loaded shard, every machine sharing test_durations.json computes the same split
+    durations = load_durations()
+    loads = [0.0] * count
+    selected = []
+    for unit in sorted((unit for unit in units if unit.name in durations), key=lambda unit: (-durations[unit.name], unit.name)):
+        shard = min(range(count), key=lambda candidate: loads[candidate])
+        loads[shard] += durations[unit.name]
+        if shard == index - 1:
+            selected.append(unit)
+    # tests without a recorded duration fall back to a stable hash of the name
+    return selected + [unit for unit in units if unit.name not in durations
+        and int(hashlib.sha256(unit.name.encode()).hexdigest(), 16) % count == index - 1]
+
+
+def load_durations():
+    if not test_times.exists():
+        return {}
+    try:
+        return json.loads(test_times.read_text())
+    except ValueError:
+        return {}
+
+
+def store_durations(durations, units):
+    durations.update({unit.name: round(unit.duration, 3) for unit in units if unit.status in ("passed", "skipped", "failed")})
+    test_times.parent.mkdir(parents=True, exist_ok=True)
+    test_times.write_text(json.dumps(durations, indent=2, sort_keys=True))
+
+
+def _all_skipped(unit):
+    # fixture setups and cleanups pass around a skipped test, only the tests themselves decide
+    results = dict(re.findall(r"Test +#\d+: (.+?) \.*\s*(\*\*\*Skipped|Passed)\b", unit.output))
+    primary = [test["name"] for test in unit.definition
+        if not test["properties"].get("FIXTURES_SETUP") and not test["properties"].get("FIXTURES_CLEANUP")]
+    primary = primary or [test["name"] for test in unit.definition]
+    return all(results.get(name) == "***Skipped" for name in primary)
+
+
+def run_unit(unit):
+    start = time.monotonic()
+    try:
+        result = traced_run(unit.command, cwd=unit.cwd, env=dict(os.environ, **unit.environment), stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, timeout=unit.timeout)
+        unit.output = result.stdout.decode(errors="replace")
+        unit.status = "passed" if (result.returncode == 0) != unit.will_fail else "failed"
+        if unit.status == "passed" and unit.definition and _all_skipped(unit):
+            unit.status = "skipped"
+    except subprocess.TimeoutExpired as expired:
+        unit.output = (expired.output or b"").decode(errors="replace") + "\nTimed out after {}s".format(unit.timeout)
+        unit.status = "failed"
+    except OSError as error:
+        unit.output = str(error)
+        unit.status = "failed"
+    unit.duration = time.monotonic() - start
+
+
+def print_unit(unit, verbose):
+    if unit.status == "passed":
+        print(green_text("PASS") + " {} ({:.2f}s)".format(unit.name, unit.duration))
+    elif unit.status == "cached":
+        print(blue_text("CACHED") + " " + unit.name)
+    elif unit.status == "skipped":
+        print(yellow_text("SKIP") + " {} ({:.2f}s)".format(unit.name, unit.duration))
+    else:
+        print(red_text("FAIL") + " {} ({:.2f}s)".format(unit.name, unit.duration))
+    if unit.output.strip() and (verbose or unit.status == "failed"):
+        print('\n'.join("    " + line for line in unit.output.rstrip().splitlines()))
+
+
+class _SerialLane:
+    # RUN_SERIAL tests wait for everything else to finish and run alone
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.running = 0
+        self.serial_running = False
+        self.serial_waiting = 0
+
+    def acquire(self, serial):
+        with self.condition:
+            if serial:
+                self.serial_waiting += 1
+                self.condition.wait_for(lambda: not self.serial_running and not self.running)
+                self.serial_waiting -= 1
+                self.serial_running = True
+            else:
+                self.condition.wait_for(lambda: not self.serial_running and not self.serial_waiting)
+                self.running += 1
+
+    def release(self, serial):
+        with self.condition:
+            if serial:
+                self.serial_running = False
+            else:
+                self.running -= 1
+            self.condition.notify_all()
+
+
+def run_tests(units, workers, verbose, use_cache, data):
+    # longest first, unknown units count as the longest, so the slowest ones never start last
+    durations = load_durations()
+    units = sorted(units, key=lambda unit: (-durations.get(unit.name, float("inf")), unit.name))
+    lock = threading.Lock()
+    lane = _SerialLane()
+    # RESOURCE_LOCK names, always taken in sorted order and before the lane so two units never wait on each other
+    resources = {name: threading.Lock() for unit in units for name in unit.locks}
+
+    def execute(unit):
+        # keys are hashed by the workers too, passes are recorded even when the cache is bypassed
+        key = cache_key(unit, data) if unit.status == "pending" else None
+        if key and use_cache and is_cached(key):
+            unit.status = "cached"
+        if unit.status == "pending":
+            for name in unit.locks:
+                resources[name].acquire()
+            lane.acquire(unit.serial)
+            try:
+                run_unit(unit)
+            finally:
+                lane.release(unit.serial)
+                for name in reversed(unit.locks):
+                    resources[name].release()
+            if key and unit.status == "passed":
+                record_pass(key, unit)
+        # the whole output of a unit is printed at once, so units never interleave
+        with lock:
+            print_unit(unit, verbose)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(execute, units))
+    store_durations(durations, units)
+    evict_stale_entries()
+
+    counts = {status: sum(unit.status == status for unit in units) for status in ("passed", "cached", "skipped", "failed")}
+    print("\n{} passed, {} cached, {} skipped, {} failed in {:.1f}s".format(counts["passed"], counts["cached"], counts["skipped"],
+        counts["failed"], time.monotonic() - start))
+    failed = [unit for unit in units if unit.status == "failed"]
+    for unit in failed:
+        print(red_text("  failed: ") + unit.name)
+    return not failed
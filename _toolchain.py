@@ -0,0 +1,156 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+
+from _paths import toolchain
+from _tracing import traced_run
+
+
+record = None
+_lock = threading.Lock()
+
+
+def _search_path():
+    return os.environ.get("PATH", "") + os.pathsep + os.environ.get("PATHEXT", "")
+
+
+def _load():
+    global record
+    if record is None:
+        try:
+            record = json.loads(toolchain.read_text())
+        except (OSError, ValueError):
+            record = {}
+        # any change to PATH may resolve every tool differently
+        if record.get("search_path") != _search_path():
+            record = {"search_path": _search_path(), "tools": {}}
+    return record["tools"]
+
+
+def _save():
+    toolchain.parent.mkdir(parents=True, exist_ok=True)
+    staging = toolchain.with_name(toolchain.name + ".{}.partial".format(os.getpid()))
+    staging.write_text(json.dumps(record, indent=2, sort_keys=True))
+    os.replace(str(staging), str(toolchain))
+
+
+def _identity(path):
+    # an upgrade replaces the binary or repoints its symlink
+    resolved = os.path.realpath(path)
+    return resolved, os.stat(resolved).st_mtime_ns
+
+
+def _entry(tool):
+    tools = _load()
+    entry = tools.get(tool)
+    if entry:
+        try:
+            if [entry["resolved"], entry["mtime"]] == list(_identity(entry["path"])):
+                return entry
+        except OSError:
+            pass
+    # a missing tool is not remembered, installing it must not require a PATH change
+    path = shutil.which(tool)
+    if path is None:
+        if tools.pop(tool, None):
+            _save()
+        return None
+    resolved, mtime = _identity(path)
+    entry = tools[tool] = {"path": path, "resolved": resolved, "mtime": mtime}
+    _save()
+    return entry
+
+
+def _probe(tool, key, command):
+    with _lock:
+        entry = _entry(tool)
+        if entry is None:
+            return None
+        if key not in entry:
+            result = traced_run([entry["path"]] + command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace")
+            entry[key] = result.stdout
+            _save()
+        return entry[key]
+
+
+def get_tool_identities():
+    # the binaries every known tool resolves to right now, a compiler upgraded in place changes them without touching PATH
+    identities = {}
+    with _lock:
+        for tool, entry in _load().items():
+            try:
+                identities[tool] = [entry["path"]] + list(_identity(entry["path"]))
+            except OSError:
+                pass
+    return identities
+
+
+def tools_unchanged(identities):
+    for path, resolved, mtime in identities.values():
+        try:
+            if list(_identity(path)) != [resolved, mtime]:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def find_tool(tool):
+    with _lock:
+        entry = _entry(tool)
+    return entry["path"] if entry else None
+
+
+def get_version_output(tool):
+    # msvc's cl has no --version, it prints its banner anyway
+    return _probe(tool, "version", [] if tool == "cl" else ["--version"])
+
+
+def get_version(tool):
+    output = get_version_output(tool) or ""
+    match = re.search(r"(\d+)\.(\d+)(?:\.(\d+))?", output)
+    return tuple(int(part) for part in match.groups() if part is not None) if match else ()
+
+
+def get_target_triple(tool):
+    if tool == "rustc":
+        match = re.search(r"^host: (\S+)", _probe(tool, "target", ["-vV"]) or "", re.MULTILINE)
+        return match.group(1) if match else None
+    if tool == "cl":
+        return None
+    return (_probe(tool, "target", ["-dumpmachine"]) or "").strip() or None
+
+
+def read_profile_settings(profile_path, settings=None):
+    # included components are read first, the including profile overrides them
+    settings = settings if settings is not None else {}
+    section = None
+    for line in profile_path.read_text().splitlines():
+        line = line.strip()
+        include = re.match(r"include\((.+)\)$", line)
+        if include:
+            read_profile_settings((profile_path.parent / include.group(1)).resolve(), settings)
+        elif line.startswith('['):
+            section = line
+        elif section == "[settings]" and '=' in line:
+            key, value = line.split('=', 1)
+            settings[key.strip()] = value.strip()
+    return settings
+
+
+def get_profile_mismatch(profile_path, tool):
+    # returns the pinned and the installed compiler version when they differ
+    pinned = read_profile_settings(profile_path).get("compiler.version")
+    installed = get_version(tool)
+    if not pinned or not installed:
+        return None
+    if tool == "cl":
+        # msvc is pinned by its toolset, 19.40 is 194
+        installed = ("{}{}".format(installed[0], installed[1] // 10),) if len(installed) > 1 else installed
+    pinned_parts = pinned.split('.')
+    if [str(part) for part in installed[:len(pinned_parts)]] == pinned_parts:
+        return None
+    return pinned, '.'.join(str(part) for part in installed)
@@ -0,0 +1,124 @@
+import atexit
+import functools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from _text_colors import green_text
+from _paths import traces_dir
+
+
+kept_traces = 20
+
+enabled = False
+events = []
+_lock = threading.Lock()
+
+
+class _Span:
+    def __init__(self, name, details):
+        self.name = name
+        self.details = details
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self.details
+
+    def __exit__(self, *_):
+        end = time.perf_counter_ns()
+        event = {"name": self.name, "ph": "X", "ts": self.start // 1000, "dur": (end - self.start) // 1000,
+            "pid": os.getpid(), "tid": threading.get_ident(), "args": self.details}
+        with _lock:
+            events.append(event)
+        return False
+
+
+class _NoSpan:
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, *_):
+        return False
+
+
+_no_span = _NoSpan()
+
+
+def span(name, **details):
+    # while tracing is off this is a single check, callers may still fill in the details they get
+    if not enabled:
+        return _no_span
+    return _Span(name, details)
+
+
+def traced(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*arguments, **keywords):
+            if not enabled:
+                return function(*arguments, **keywords)
+            with _Span(name, {}):
+                return function(*arguments, **keywords)
+        return wrapper
+    return decorator
+
+
+def describe_command(command):
+    return ' '.join(str(part) for part in command) if isinstance(command, (list, tuple)) else str(command)
+
+
+def command_span(command, cwd):
+    if not enabled:
+        return _no_span
+    program = command[0] if isinstance(command, (list, tuple)) else command.split()[0]
+    return _Span(Path(str(program)).name, {"command": describe_command(command), "cwd": str(cwd or os.getcwd())})
+
+
+def traced_run(command, **keywords):
+    # subprocess.run for the tooling, recorded like run_command while tracing
+    with command_span(command, keywords.get("cwd")) as details:
+        result = subprocess.run(command, **keywords)
+        details["exit_code"] = result.returncode
+    return result
+
+
+def traced_popen(command, **keywords):
+    # processes that outlive their caller only record how they were started
+    with command_span(command, keywords.get("cwd")) as details:
+        process = subprocess.Popen(command, **keywords)
+        details["pid"] = process.pid
+    return process
+
+
+def enable_tracing():
+    global enabled
+    if enabled:
+        return
+    enabled = True
+    # child processes, like the builds of --matrix, write traces of their own
+    os.environ["TOOLING_TRACE"] = "1"
+    atexit.register(write_trace, time.perf_counter_ns())
+
+
+def write_trace(start):
+    script = Path(sys.argv[0]).stem or "python"
+    with _lock:
+        recorded = list(events)
+    recorded.append({"name": Path(sys.argv[0]).name or "python", "ph": "X", "ts": start // 1000, "dur": (time.perf_counter_ns() - start) // 1000,
+        "pid": os.getpid(), "tid": threading.main_thread().ident, "args": {"command": describe_command(sys.argv)}})
+    recorded.append({"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": describe_command(sys.argv)}})
+
+    traces_dir.mkdir(parents=True, exist_ok=True)
+    trace_path = traces_dir / "{}-{}-{}.json".format(time.strftime("%Y%m%d-%H%M%S"), script, os.getpid())
+    trace_path.write_text(json.dumps({"traceEvents": recorded, "displayTimeUnit": "ms"}))
+    for stale in sorted(traces_dir.glob("*.json"))[:-kept_traces]:
+        stale.unlink()
+    print("Trace: " + green_text(str(trace_path)) + " (open in chrome://tracing or ui.perfetto.dev)")
+
+
+if os.environ.get("TOOLING_TRACE"):
+    enable_tracing()
@@ -0,0 +1,166 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+
+from _text_colors import blue_text, green_text, red_text, yellow_text
+from _noop_index import digest_tree, skipped_directories
+
+
+debounce_seconds = 0.25
+polling_seconds = 0.5
+
+IN_MODIFY      = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ISDIR       = 0x40000000
+watched_events = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+event_header   = struct.Struct("iIII")
+
+
+def is_ignored(name):
+    # hidden files and editor swap/backup files never affect the build
+    return name in skipped_directories or name.startswith('.') or name.endswith(('~', ".swp", ".swx")) or name == "4913"
+
+
+class InotifyWatcher:
+    def __init__(self, roots):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        self.roots = roots
+        for root in roots:
+            self.add_tree(Path(root))
+
+    def add_tree(self, directory):
+        descriptor = self.libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), watched_events)
+        if descriptor < 0:
+            if ctypes.get_errno() == 28:  # ENOSPC
+                raise OSError(28, "inotify watch limit reached, raise fs.inotify.max_user_watches")
+            return
+        self.directories[descriptor] = directory
+        try:
+            subdirectories = [entry for entry in os.scandir(str(directory)) if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return
+        for entry in subdirectories:
+            if not is_ignored(entry.name):
+                self.add_tree(Path(entry.path))
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            buffer = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset + event_header.size <= len(buffer):
+            descriptor, mask, _, length = event_header.unpack_from(buffer, offset)
+            name = buffer[offset + event_header.size:offset + event_header.size + length].rstrip(b"\0").decode(errors="replace")
+            offset += event_header.size + length
+            if mask & IN_Q_OVERFLOW:
+                # events were lost, so every root is assumed changed
+                changed.update(Path(root) for root in self.roots)
+                continue
+            if mask & IN_IGNORED:
+                self.directories.pop(descriptor, None)
+                continue
+            directory = self.directories.get(descriptor)
+            if directory is None or not name or is_ignored(name):
+                continue
+            path = directory / name
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_tree(path)
+            changed.add(path)
+        return changed
+
+
+class PollingWatcher:
+    def __init__(self, roots):
+        self.roots = [Path(root) for root in roots]
+        self.digests = {root: digest_tree(root) for root in self.roots}
+
+    def wait(self, timeout):
+        time.sleep(max(timeout, polling_seconds))
+        changed = set()
+        for root in self.roots:
+            digest = digest_tree(root)
+            if digest != self.digests[root]:
+                self.digests[root] = digest
+                changed.add(root)
+        return changed
+
+
+def create_watcher(roots):
+    if sys.platform == "linux":
+        try:
+            return InotifyWatcher(roots)
+        except (OSError, AttributeError) as error:
+            print(yellow_text("inotify is unavailable: {}".format(error)) + ", polling for changes instead")
+    return PollingWatcher(roots)
+
+
+def affected_languages(paths, roots):
+    # a path belongs to the most specific root containing it, so nested projects trigger only their own build
+    languages = set()
+    for path in paths:
+        owners = [(len(root.parts), language) for language, root in roots.items() if path == root or root in path.parents]
+        if owners:
+            languages.add(max(owners)[1])
+    return languages
+
+
+def watch(roots, start_build, stop_build):
+    watcher = create_watcher(list(roots.values()))
+    print(blue_text("Watching ") + ", ".join("{} in {}".format(language, root) for language, root in roots.items())
+        + "\nPress Ctrl+C to stop")
+
+    pending = set()
+    last_change = 0.0
+    running = None
+    running_languages = set()
+    started = 0.0
+    try:
+        while True:
+            changed = watcher.wait(debounce_seconds / 2)
+            languages = affected_languages(changed, roots)
+            if languages:
+                pending |= languages
+                last_change = time.monotonic()
+
+            if running and running.poll() is not None:
+                elapsed = time.monotonic() - started
+                if running.returncode == 0:
+                    print(green_text("Rebuilt " + ", ".join(sorted(running_languages))) + " in {:.1f}s".format(elapsed))
+                else:
+                    print(red_text("Failed to rebuild " + ", ".join(sorted(running_languages))) + " in {:.1f}s".format(elapsed))
+                running = None
+
+            if pending and time.monotonic() - last_change >= debounce_seconds:
+                if running:
+                    print(yellow_text("Sources changed mid-build") + ", restarting")
+                    stop_build(running)
+                    pending |= running_languages
+                running_languages = pending
+                pending = set()
+                started = time.monotonic()
+                running = start_build(running_languages)
+    except KeyboardInterrupt:
+        if running:
+            stop_build(running)
+        print("\nStopped watching")
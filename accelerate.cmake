@@ -0,0 +1,60 @@
+# included by every project() through CMAKE_PROJECT_INCLUDE when project_config.toml asks for precompiled headers,
+# excludes targets from the acceleration or selects the fast link profile
+
+if(CMAKE_VERSION VERSION_LESS 3.19)
+    message(WARNING "precompile_headers, acceleration_exclude and link_profile need CMake 3.19 or later, ignoring them")
+    return()
+endif()
+
+get_property(tooling_deferred GLOBAL PROPERTY TOOLING_ACCELERATION_DEFERRED)
+if(tooling_deferred)
+    # nested projects inherit everything from the top level one
+    return()
+endif()
+set_property(GLOBAL PROPERTY TOOLING_ACCELERATION_DEFERRED TRUE)
+
+if(TOOLING_FAST_LINK AND (CMAKE_CXX_COMPILER_ID MATCHES "GNU|Clang" OR CMAKE_C_COMPILER_ID MATCHES "GNU|Clang"))
+    if(TOOLING_FAST_LINKER)
+        if(CMAKE_VERSION VERSION_GREATER_EQUAL 3.29)
+            string(TOUPPER "${TOOLING_FAST_LINKER}" CMAKE_LINKER_TYPE)
+        else()
+            add_link_options("-fuse-ld=${TOOLING_FAST_LINKER}")
+        endif()
+        # the default GNU ld can not build the index, mold and lld can
+        add_link_options("LINKER:--gdb-index")
+    endif()
+    # debug info stays in .dwo files next to the objects instead of passing through every link
+    add_compile_options("$<$<CONFIG:Debug,RelWithDebInfo>:-gsplit-dwarf>")
+    # thin archives only reference the objects, they are not meant to be installed
+    foreach(language IN ITEMS C CXX)
+        set(CMAKE_${language}_ARCHIVE_CREATE "<CMAKE_AR> qcT <TARGET> <LINK_FLAGS> <OBJECTS>")
+        set(CMAKE_${language}_ARCHIVE_APPEND "<CMAKE_AR> qT <TARGET> <LINK_FLAGS> <OBJECTS>")
+    endforeach()
+endif()
+
+function(tooling_accelerate_targets directory)
+    get_property(targets DIRECTORY "${directory}" PROPERTY BUILDSYSTEM_TARGETS)
+    foreach(target IN LISTS targets)
+        get_target_property(type ${target} TYPE)
+        if(NOT type MATCHES "^(EXECUTABLE|STATIC_LIBRARY|SHARED_LIBRARY|MODULE_LIBRARY|OBJECT_LIBRARY)$")
+            continue()
+        endif()
+        if(target IN_LIST TOOLING_ACCELERATION_EXCLUDE)
+            set_target_properties(${target} PROPERTIES UNITY_BUILD OFF)
+            continue()
+        endif()
+        # C sources of mixed targets must not include C++ headers
+        foreach(header IN LISTS TOOLING_PRECOMPILE_HEADERS)
+            string(REPLACE ">" "$<ANGLE-R>" header "${header}")
+            target_precompile_headers(${target} PRIVATE "$<$<COMPILE_LANGUAGE:CXX>:${header}>")
+        endforeach()
+    endforeach()
+
+    get_property(subdirectories DIRECTORY "${directory}" PROPERTY SUBDIRECTORIES)
+    foreach(subdirectory IN LISTS subdirectories)
+        tooling_accelerate_targets("${subdirectory}")
+    endforeach()
+endfunction()
+
+# the targets are adjusted once the top level directory was processed
+cmake_language(DEFER DIRECTORY "${CMAKE_SOURCE_DIR}" CALL tooling_accelerate_targets "${CMAKE_SOURCE_DIR}")
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from prebootstrap import uv_version
+from _text_colors import blue_text, green_text, red_text, yellow_text
+from _paths import script_dir, bench_base
+
+
+stubbed_tools = ("cmake", "cargo", "conan", "ninja", "uv", "git", "gcc", "g++")
+minimal_regression = 0.02  # seconds, smaller differences are noise
+
+# runs an entry point inside the measured interpreter and counts every process it starts
+harness = """
+import os, runpy, sys
+script, spawn_log = sys.argv[1], sys.argv[2]
+spawns = []
+sys.addaudithook(lambda event, _: spawns.append(event) if event in ("subprocess.Popen", "os.system", "os.exec", "os.spawn") else None)
+sys.argv = [script] + sys.argv[3:]
+sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+try:
+    runpy.run_path(script, run_name="__main__")
+finally:
+    open(spawn_log, "w").write(str(len(spawns)))
+"""
+
+project_config = """[cmake]
+path = "cpp"
+compiler = "gcc"
+use_ninja = true
+shared_libs = false
+targets = [ "all" ]
+
+[rust]
+path = "rust"
+features = [ "" ]
+
+[migration]
+legacy_build = false
+
+[test]
+path = "test.py"
+"""
+
+
+def write_stubs(stub_dir):
+    stub_dir.mkdir(parents=True, exist_ok=True)
+    stub = str(script_dir / "_benchmark_stub.py")
+    for tool in stubbed_tools:
+        if sys.platform == "win32":
+            (stub_dir / (tool + ".cmd")).write_text('@"{}" -S "{}" {} %*\n'.format(sys.executable, stub, tool))
+        else:
+            wrapper = stub_dir / tool
+            wrapper.write_text('#!/bin/sh\nexec "{}" -S "{}" {} "$@"\n'.format(sys.executable, stub, tool))
+            wrapper.chmod(0o755)
+
+
+def create_project(project, conan=False):
+    if project.exists():
+        shutil.rmtree(project)
+    tooling = project / "tooling"
+    tooling.mkdir(parents=True)
+    for source in script_dir.glob("*.py"):
+        shutil.copy2(str(source), str(tooling / source.name))
+    shutil.copytree(script_dir / "conan_profiles", tooling / "conan_profiles")
+    for name in (".justfile", "requirements.txt"):
+        shutil.copy2(str(script_dir / name), str(project / name))
+    (project / "project_config.toml").write_text(project_config)
+    (project / "test.py").write_text("print('ok')\n")
+    (project / "cpp").mkdir()
+    (project / "cpp" / "CMakeLists.txt").write_text("cmake_minimum_required(VERSION 3.20)\nproject(bench CXX)\nadd_executable(bench main.cpp)\n")
+    (project / "cpp" / "main.cpp").write_text("int main() { return 0; }\n")
+    if conan:
+        (project / "cpp" / "conanfile.txt").write_text("[generators]\nCMakeToolchain\n\n[layout]\ncmake_layout\n")
+    (project / "rust" / "src").mkdir(parents=True)
+    (project / "rust" / "Cargo.toml").write_text('[package]\nname = "bench"\nversion = "0.1.0"\nedition = "2021"\n')
+    (project / "rust" / "src" / "main.rs").write_text("fn main() {}\n")
+
+
+def touch_sources(project):
+    for source in (project / "cpp" / "main.cpp", project / "rust" / "src" / "main.rs"):
+        source.write_text(source.read_text() + "\n")
+
+
+# name, entry point, arguments, preparation before every measured run, whether a priming run precedes the measurements
+scenarios = [
+    ("build-cold", "build.py", ["--config=Release"], lambda project: create_project(project), False),
+    ("build-incremental", "build.py", ["--config=Release"], touch_sources, True),
+    ("build-noop", "build.py", ["--config=Release"], None, True),
+    ("conan-cold", "build.py", ["--config=Release"], lambda project: create_project(project, conan=True), False),
+    ("conan-incremental", "build.py", ["--config=Release"], touch_sources, True),
+    ("history", "build.py", ["--history"], None, True),
+    ("bootstrap", "bootstrap.py", [], None, True),
+    ("launchIDE", "launchIDE.py", [], None, False),
+]
+
+
+def read_import_time(stderr):
+    # -X importtime reports the self time of every imported module in microseconds
+    total = 0
+    for line in stderr.splitlines():
+        if line.startswith("import time:"):
+            self_time = line[len("import time:"):].split('|')[0].strip()
+            total += int(self_time) if self_time.isdigit() else 0
+    return total / 1e6
+
+
+def run_once(project, script, arguments, environment, work_dir):
+    spawn_log = work_dir / "spawns.txt"
+    tool_log = Path(environment["TOOLING_BENCH_LOG"])
+    tool_log.write_text("")
+    command = [sys.executable, "-X", "importtime", "-c", harness, str(project / "tooling" / script), str(spawn_log)] + arguments
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=str(project), env=environment, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        print(red_text("{} {} failed".format(script, ' '.join(arguments))) + '\n' + result.stdout
+            + '\n'.join(line for line in result.stderr.splitlines() if not line.startswith("import time:")))
+        return None
+    return {"wall": wall, "imports": read_import_time(result.stderr), "spawns": int(spawn_log.read_text() or 0),
+        "tool_calls": len(tool_log.read_text().splitlines())}
+
+
+def measure(name, script, arguments, prepare, prime, repeat, root):
+    project = root / name
+    create_project(project, conan=name.startswith("conan"))
+    environment = dict(os.environ, PATH=str(root / "stubs") + os.pathsep + os.environ.get("PATH", ""),
+        TOOLING_STORE=str(root / "store"), TOOLING_BENCH_LOG=str(root / "tools.log"))
+    environment.pop("TOOLING_NO_FAST_PATH", None)
+    if prime and run_once(project, script, arguments, environment, root) is None:
+        return None
+
+    samples = []
+    for _ in range(repeat):
+        if prepare:
+            prepare(project)
+        sample = run_once(project, script, arguments, environment, root)
+        if sample is None:
+            return None
+        samples.append(sample)
+    return {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+
+
+def find_regressions(result, baseline, tolerance):
+    regressions = []
+    for key in ("wall", "imports"):
+        if result[key] > baseline[key] * (1 + tolerance) and result[key] - baseline[key] > minimal_regression:
+            regressions.append("{} {:.3f}s > {:.3f}s".format(key, result[key], baseline[key]))
+    for key in ("spawns", "tool_calls"):
+        # process counts are deterministic, every extra one is a regression
+        if result[key] > baseline[key]:
+            regressions.append("{} {:g} > {:g}".format(key, result[key], baseline[key]))
+    return regressions
+
+
+def main():
+    arguments = argparse.ArgumentParser(description="measure the overhead of the tooling scripts against stub tools")
+    arguments.add_argument("--repeat", type=int, default=5, help="measured runs per scenario, the median is reported")
+    arguments.add_argument("--only", nargs='+', choices=[scenario[0] for scenario in scenarios])
+    arguments.add_argument("--baseline", type=Path, default=bench_base)
+    arguments.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    arguments.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown as a fraction of the baseline")
+    specified_arguments = arguments.parse_args()
+
+    baseline = json.loads(specified_arguments.baseline.read_text()) if specified_arguments.baseline.exists() else {}
+    root = Path(tempfile.mkdtemp(prefix="tooling-bench-"))
+    write_stubs(root / "stubs")
+    # bootstrap finds uv in the per-user store, so a stub is placed there
+    uv_home = root / "store" / "uv" / uv_version
+    uv_home.mkdir(parents=True)
+    shutil.copy2(str(root / "stubs" / "uv"), str(uv_home / "uv"))
+
+    results = {}
+    broken = False
+    regressed = False
+    print("{:<20} {:>9} {:>9} {:>7} {:>11}  {}".format("scenario", "wall", "imports", "spawns", "tool calls", "baseline"))
+    try:
+        for name, script, script_arguments, prepare, prime in scenarios:
+            if specified_arguments.only and name not in specified_arguments.only:
+                continue
+            if script == "bootstrap.py" and sys.platform == "win32":
+                # bootstrap expects uv.exe in the store, which a script stub can not provide
+                print("{:<20} {}".format(name, yellow_text("skipped on Windows")))
+                continue
+            result = measure(name, script, script_arguments, prepare, prime, specified_arguments.repeat, root)
+            if result is None:
+                broken = True
+                continue
+            results[name] = result
+            if name not in baseline:
+                verdict = yellow_text("none")
+            else:
+                regressions = find_regressions(result, baseline[name], specified_arguments.tolerance)
+                verdict = red_text("; ".join(regressions)) if regressions else green_text("ok")
+                regressed = regressed or bool(regressions)
+            print("{:<20} {:>8.3f}s {:>8.3f}s {:>7g} {:>11g}  {}".format(name, result["wall"], result["imports"],
+                result["spawns"], result["tool_calls"], verdict))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if specified_arguments.update_baseline:
+        baseline.update(results)
+        specified_arguments.baseline.parent.mkdir(parents=True, exist_ok=True)
+        specified_arguments.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+        print("Baseline stored in " + blue_text(str(specified_arguments.baseline)))
+        # the new numbers are the baseline now, differences to the old one are only reported
+        regressed = False
+    elif not baseline:
+        print("No baseline yet, store one with " + green_text("python tooling/benchmark.py --update-baseline"))
+
+    sys.exit(1 if broken or regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
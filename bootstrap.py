@@ -2,14 +2,16 @@
 
 from pathlib import Path
 import sys
-import subprocess
 import shutil
+import hashlib
 
 from prebootstrap import prime_uv
 from _platform_specific import prime_python, get_activation_hint
 from _resource_manager import resolve_resource
 from _text_colors import blue_text, red_text, yellow_text, green_text
-from _paths import main_project, venv_python, requirements, venv_path, tooling_path
+from _paths import main_project, venv_python, requirements, venv_path, tooling_path, pip_stamp
+from _toolchain import find_tool
+from _tracing import traced_run
 
 
 def running_in_native_venv() -> bool:
@@ -25,11 +27,11 @@ def running_in_native_venv() -> bool:
 
 
 def check_optional_utils():
-    if not shutil.which("code"):
+    if not find_tool("code"):
         print(yellow_text("Visual Studio Code can not be found.") +" Install it to use `just vscode` command (optional)")
-    if not shutil.which("zed"):
+    if not find_tool("zed"):
         print("Zed can not be found. Install it to use `just zed` command (optional)")
-    if not shutil.which("just"):
+    if not find_tool("just"):
         print(yellow_text("just is missing.") + " Install just 1.27 or later to use just commands (recommended)")
 
 
@@ -50,6 +52,16 @@ def clean_tooling_artifacts(proper_venv):
     sys.exit(0)
 
 
+def get_pip_stamp(local_uv):
+    # pyvenv.cfg pins the interpreter, its mtime changes whenever the venv is recreated
+    venv_config = venv_path / "pyvenv.cfg"
+    interpreter = venv_config.read_text() + str(venv_config.stat().st_mtime_ns) if venv_config.exists() else sys.executable
+    digest = hashlib.sha256()
+    for part in (requirements.read_bytes(), interpreter.encode(), str(local_uv).encode()):
+        digest.update(part + b"\0")
+    return digest.hexdigest()
+
+
 def main():
     proper_venv = running_in_native_venv()
     if "--clean" in sys.argv:
@@ -63,12 +75,18 @@ def main():
     local_uv = prime_uv()
     if not proper_venv:
         if not venv_python.exists():
-            subprocess.run([local_uv, "venv", "--python", "3.13"], check=True, cwd=str(main_project))
-            subprocess.run([local_uv, "pip", "install", "--upgrade", "pip"], check=True, cwd=str(main_project))
+            traced_run([local_uv, "venv", "--python", "3.13"], check=True, cwd=str(main_project))
+            traced_run([local_uv, "pip", "install", "--upgrade", "pip"], check=True, cwd=str(main_project))
     prime_python(venv_python)
 
-    print(f"Adding the requirements from {str(requirements)}")
-    subprocess.run([local_uv, "pip", "install", "-r", str(requirements)], check=True, cwd=str(main_project))
+    stamp = get_pip_stamp(local_uv)
+    if pip_stamp.exists() and pip_stamp.read_text() == stamp:
+        print(green_text("Requirements are up to date") + f" with {str(requirements)}")
+    else:
+        print(f"Adding the requirements from {str(requirements)}")
+        traced_run([local_uv, "pip", "install", "-r", str(requirements)], check=True, cwd=str(main_project))
+        tooling_path.mkdir(exist_ok=True)
+        pip_stamp.write_text(stamp)
 
     if not proper_venv:
         print("\n\nDon't forget to activate your virtual environment:\n" + green_text(get_activation_hint()))
@@ -1,43 +1,121 @@
 #!/usr/bin/env python3
 
-import argparse
-from _text_colors import blue_text
 import sys
+from _noop_index import try_fast_path
+
+# an unchanged tree is detected before the rest of the tooling is even imported
+if __name__ == "__main__" and try_fast_path(sys.argv[1:]):
+    sys.exit(0)
+
+import argparse
+import os
+from _text_colors import blue_text, green_text, red_text, yellow_text
 import shutil
-import subprocess
-from _platform_specific import prime_environment
+import time
+from _platform_specific import prime_environment, start_process_tree, terminate_process_tree, exclusive_lock
+from _scheduler import Job, run_jobs, run_command, default_budget
+from _fingerprint import is_configured, record_configure, forget_configure
+from _conan_cache import restore_conan_install, store_conan_install, report_conan_cache
+from _compiler_cache import snapshot_statistics, report_compiler_cache
+from _ninja_report import report_ninja_build
+from _cargo_report import CargoMessages, summarize_cargo_build
+from _build_history import append_record, record_clean, warn_regressions, print_history, get_git_revision, read_records
+from _noop_index import snapshot_inputs, record_success, invalidate
+from _watcher import watch
+from _cleaning import move_to_trash, start_background_purge, purge_trash, prune
+from _artifact_cache import is_enabled, restore_artifacts, store_artifacts, report_artifact_cache
+from _job_budget import shared_jobserver
+from _matrix import get_matrix_entries, run_matrix, build_entry
+from _tracing import traced, enable_tracing
+from _affected import request_codemodel, changed_files, affected_cmake_targets, affected_cargo_packages, describe
+from _paths import reports_dir, script_dir, configured, conan_cache
 from _resource_manager import update_project_config, check_presence, get_verified_path
-from _resource_manager import get_compiler, get_generate_command, get_build_command
-from _resource_manager import get_cargo_target, get_cargo_features
-from _resource_manager import build_and_verify, get_last_used_config, set_last_used_config
+from _resource_manager import get_compiler, get_generate_command, get_build_command, get_preset_command, get_conanfile
+from _resource_manager import get_cargo_target, get_cargo_features, get_build_dir, get_configure_fingerprint
+from _resource_manager import get_conan_cache_key, get_configuration_types, is_multi_config, get_artifact_key, uses_ninja
+from _resource_manager import build_and_verify, get_last_used_config, get_variant_name, load_config, set_targets
+from _resource_manager import format_variant, is_matrix_build, get_cargo_link_arguments, uses_fast_link, get_last_used_variant
 
 
 success = True
+force_configure = False
+partial_build = False
+narrowed_build = False
+refresh_deps = False
+clean_first = False
 cmake_directory = None
 rust_directory = None
+cargo_packages = None
+cargo_summaries = {}
+
+
+@traced("configure")
+def configure_once(build_type, description, configure_command, fingerprint):
+    build_dir = get_build_dir(cmake_directory, build_type)
+    if not force_configure and is_configured(build_dir, fingerprint):
+        print(green_text("Configure inputs unchanged") + ", reusing " + str(build_dir))
+        return True
+
+    print(description + ' '.join(configure_command))
+    forget_configure(build_dir)
+    request_codemodel(build_dir)
+    if run_command(configure_command, cmake_directory).returncode != 0:
+        return False
+    record_configure(build_dir, fingerprint)
+    return True
+
+
+@traced("conan install")
+def install_conan(build_type, generate_command):
+    build_dir = get_build_dir(cmake_directory, build_type)
+    cache_key = get_conan_cache_key(cmake_directory, build_type, generate_command)
+    # concurrent --matrix builds are separate processes, the conan cache still takes one install at a time
+    with exclusive_lock(conan_cache / "install.lock"):
+        if refresh_deps:
+            generate_command += ["--update"]
+        elif restore_conan_install(cache_key, cmake_directory, build_dir):
+            return True
+
+        print("Generating CMake project: " + ' '.join(generate_command))
+        if run_command(generate_command, cmake_directory).returncode != 0:
+            return False
+        store_conan_install(cache_key, build_dir)
+    return True
 
 
 def generate_cmake(build_type):
     check_presence("cmake")
     generate_command = get_generate_command(cmake_directory, build_type)
-    print("Generating CMake project: " + ' '.join(generate_command))
-    subprocess.run(generate_command, cwd=str(cmake_directory), check=True)
+    if get_conanfile(cmake_directory):
+        return install_conan(build_type, generate_command)
+
+    fingerprint = get_configure_fingerprint(cmake_directory, build_type, [generate_command])
+    return configure_once(build_type, "Generating CMake project: ", generate_command, fingerprint)
+
+
+def configure_preset(build_type):
+    check_presence("cmake")
+    preset_command = get_preset_command(cmake_directory, build_type)
+    commands = [get_generate_command(cmake_directory, config) for config in get_configuration_types(build_type)]
+    commands.append(preset_command)
+    fingerprint = get_configure_fingerprint(cmake_directory, build_type, commands)
+    return configure_once(build_type, "Configuring CMake preset: ", preset_command, fingerprint)
 
 
+@traced("build")
 def build_cmake(build_type):
-    build_command = get_build_command(cmake_directory, build_type)
+    build_command = get_build_command(cmake_directory, build_type) + (["--clean-first"] if clean_first else [])
     print("Building CMake project: " + ' '.join(build_command))
-
-    if not build_and_verify(build_command, cmake_directory):
-        global success
-        success = False
+    return build_and_verify(build_command, cmake_directory)
 
 
+@traced("cargo")
 def build_rust(build_type):
     print("Building " + build_type + " rust in " + str(rust_directory))
     check_presence("cargo")
 
-    build_command = ["cargo", "build"]
+    # json messages give the artifacts and which crates were rebuilt, --timings the per-crate durations
+    build_command = ["cargo", "build", "--message-format=json-diagnostic-rendered-ansi", "--timings"]
     if build_type == "Release":
         build_command.append("--release")
 
@@ -49,8 +127,252 @@ def build_rust(build_type):
     if features:
         build_command += ["--features", ','.join(features)]
 
+    for package in cargo_packages or ():
+        build_command += ["-p", package]
+    build_command += get_cargo_link_arguments(rust_directory)
+
     print("Building Rust project: " + ' '.join(build_command))
-    subprocess.run(build_command, cwd=str(rust_directory), check=True)
+    messages = CargoMessages()
+    succeeded = run_command(build_command, rust_directory, handle_line=messages.handle_line).returncode == 0
+    cargo_summaries[build_type] = summarize_cargo_build(messages, reports_dir, build_type)
+    return succeeded
+
+
+def schedule_config(build_type, regenerate, scheduled, restored):
+    # conan install -> cmake configure -> cmake build; cargo is independent of all of them
+    jobs = []
+    if cmake_directory and ("cmake", build_type) not in restored:
+        build_dir = get_build_dir(cmake_directory, build_type)
+        uses_conan = get_conanfile(cmake_directory) is not None
+        # a toolchain variant built for the first time has no tree yet, a plain rebuild generates it as well
+        regenerate = regenerate or not (build_dir / "CMakeCache.txt").exists()
+        conan = None
+        if uses_conan and regenerate:
+            # the conan cache is not safe for concurrent installs, so they are chained across configs
+            conan = Job("conan " + build_type, lambda: generate_cmake(build_type), scheduled["conan"][-1:], build_type)
+            scheduled["conan"].append(conan)
+            jobs.append(conan)
+
+        configure = scheduled["configure"].get(build_dir)
+        if configure:
+            # a multi-config tree is configured once, after every conan install feeding it
+            if conan:
+                configure.dependencies.append(conan)
+        elif uses_conan or regenerate:
+            action = configure_preset if uses_conan else generate_cmake
+            configure = Job("configure " + build_type, lambda: action(build_type), [conan] if conan else (), build_type)
+            scheduled["configure"][build_dir] = configure
+            jobs.append(configure)
+
+        # builds sharing a tree would race on its ninja log, so they run one after another
+        dependencies = [job for job in (configure, scheduled["build"].get(build_dir)) if job]
+        build = Job("cmake " + build_type, lambda: build_cmake(build_type), dependencies, build_type)
+        scheduled["build"][build_dir] = build
+        jobs.append(build)
+
+    if rust_directory and ("rust", build_type) not in restored:
+        jobs.append(Job("cargo " + build_type, lambda: build_rust(build_type), (), build_type))
+    return jobs
+
+
+def get_cmake_outputs(build_type):
+    build_dir = get_build_dir(cmake_directory, build_type)
+    return [build_dir, build_dir / build_type] if is_multi_config() else [build_dir]
+
+
+def get_rust_outputs(build_type):
+    profile = build_type.lower()
+    return [rust_directory / "target" / profile] + [path for path in (rust_directory / "target").glob("*/" + profile) if path.is_dir()]
+
+
+def get_output_directories(build_type):
+    directories = []
+    if cmake_directory:
+        # the outputs are walked recursively, the shared multi-config tree covers the config's own subdirectories
+        directories += get_cmake_outputs(build_type)[:1]
+    if rust_directory:
+        directories += get_rust_outputs(build_type)
+    return directories
+
+
+def restore_built_artifacts(build_configs):
+    # whole builds are looked up by content before anything runs, a hit skips the language entirely
+    keys = {}
+    restored = set()
+    if not is_enabled() or clean_first:
+        return keys, restored
+    for build_type in build_configs:
+        for language, directory in (("cmake", cmake_directory), ("rust", rust_directory)):
+            if directory:
+                keys[(language, build_type)] = get_artifact_key(language, directory, build_type)
+                if restore_artifacts(keys[(language, build_type)], language + ' ' + build_type):
+                    restored.add((language, build_type))
+    return keys, restored
+
+
+def store_built_artifacts(keys, restored, jobs):
+    if narrowed_build:
+        # only some targets were built, the outputs do not represent the whole key
+        return
+    for (language, build_type), key in keys.items():
+        tool = "cmake" if language == "cmake" else "cargo"
+        language_jobs = [job for job in jobs if job.config == build_type and job.name.split()[0] in ("conan", "configure", tool)]
+        if (language, build_type) in restored or not language_jobs or any(job.state != "succeeded" for job in language_jobs):
+            continue
+        outputs = get_cmake_outputs(build_type)[:1] if language == "cmake" else get_rust_outputs(build_type)
+        store_artifacts(key, outputs, language + ' ' + build_type)
+
+
+def run_build_graph(build_configs, regenerate, budget):
+    global success
+    compiler_cache_before = snapshot_statistics()
+    input_roots = [path for path in (cmake_directory, rust_directory, script_dir) if path]
+    inputs = snapshot_inputs(input_roots)
+    # partial builds and --matrix children never record an index, concurrent children must not race on removing it
+    if not partial_build and not is_matrix_build():
+        for build_type in build_configs:
+            invalidate(build_type)
+    artifact_keys, restored = restore_built_artifacts(build_configs)
+    cargo_summaries.clear()
+
+    jobs = []
+    scheduled = {"conan": [], "configure": {}, "build": {}}
+    for build_type in build_configs:
+        jobs += schedule_config(build_type, regenerate, scheduled, restored)
+
+    builds = [job for job in jobs if job.name.split()[0] in ("cmake", "cargo")]
+    with shared_jobserver(len(builds), uses_ninja()):
+        if not run_jobs(jobs, budget):
+            success = False
+    store_built_artifacts(artifact_keys, restored, jobs)
+    conan_statistics = report_conan_cache()
+    compiler_cache = report_compiler_cache(compiler_cache_before)
+    artifact_cache = report_artifact_cache()
+
+    # same semantics as the sequential build: the last config is remembered while every config so far succeeded
+    history_config = load_config("history") or {}
+    revision = get_git_revision()
+    remembered = True
+    for build_type in build_configs:
+        config_jobs = [job for job in jobs if job.config == build_type]
+        succeeded = all(job.state == "succeeded" for job in config_jobs)
+        # a --matrix combination is never the config a plain rebuild picks up
+        remembered = remembered and succeeded and not is_matrix_build()
+        record = {"event": "build", "time": time.time(), "config": build_type, "toolchain": get_variant_name(),
+            "revision": revision, "status": "succeeded" if succeeded else "failed", "last_used": remembered,
+            "phases": {job.name.split()[0]: round(job.duration, 3) for job in config_jobs if job.state != "skipped"},
+            "conan_cache": conan_statistics, "compiler_cache": compiler_cache, "artifact_cache": artifact_cache,
+            "cargo": cargo_summaries.get(build_type)}
+        append_record(record)
+        if succeeded and not partial_build:
+            # the other configs of a multi-config tree build into sibling directories of their own
+            other_configs = set(get_configuration_types(build_type)) - {build_type}
+            record_success(build_type, input_roots, inputs, get_output_directories(build_type), other_configs)
+        warn_regressions(record, history_config.get("regression_threshold", 0.25), history_config.get("baseline_window", 10))
+    return remembered
+
+
+def build_affected(build_type, git_ref, budget):
+    global success, cmake_directory, rust_directory, partial_build, narrowed_build, cargo_packages
+    files = changed_files(git_ref)
+    if files is None:
+        success = False
+        return
+    print("{} file{} changed against {}".format(len(files), "" if len(files) == 1 else "s", blue_text(git_ref)))
+
+    # a partial build must never mark the whole config as up to date
+    partial_build = True
+    narrowed_build = True
+    if cmake_directory:
+        build_dir = get_build_dir(cmake_directory, build_type)
+        affected = affected_cmake_targets(files, cmake_directory, build_dir, build_type)
+        print(describe("CMake targets", affected))
+        if affected == set():
+            cmake_directory = None
+        elif affected:
+            set_targets(sorted(affected))
+    if rust_directory:
+        cargo_packages = affected_cargo_packages(files, rust_directory)
+        print(describe("Cargo packages", cargo_packages))
+        if cargo_packages == set():
+            rust_directory = None
+
+    if not cmake_directory and not rust_directory:
+        print(green_text("Nothing affected") + ", no build needed")
+        return
+    run_build_graph([build_type], True, budget)
+
+
+def build_matrix(build_type, budget):
+    global success
+    if not cmake_directory:
+        print(red_text("--matrix needs a [cmake] section") + ", the combinations are CMake settings")
+        success = False
+        return
+    matrix_config = load_config("matrix") or {}
+    cmake_config = load_config("cmake") or {}
+    entries = get_matrix_entries(matrix_config, cmake_config)
+    names = [format_variant(entry.get("compiler") or "clang", entry.get("use_ninja", False), entry.get("shared_libs", False),
+        cmake_config.get("multi_config", False), cmake_config.get("unity_build", False), bool(cmake_config.get("precompile_headers")),
+        uses_fast_link()) for entry in entries]
+    build_configs = [build_type] if build_type else matrix_config.get("configs", ["Release"])
+
+    # every child joins this jobserver, so all combinations together stay within the machine's budget
+    with shared_jobserver(len(entries) * len(build_configs), all(entry.get("use_ninja", False) for entry in entries)):
+        if not run_matrix(entries, names, build_configs, budget):
+            success = False
+
+
+def compare_acceleration(build_type, target):
+    global success
+    if not cmake_directory:
+        print(red_text("--compare-accel needs a [cmake] section"))
+        success = False
+        return
+    cmake_config = load_config("cmake") or {}
+    accelerated = {"unity_build": cmake_config.get("unity_build", False), "precompile_headers": cmake_config.get("precompile_headers", [])}
+    if not accelerated["unity_build"] and not accelerated["precompile_headers"]:
+        print(yellow_text("Neither unity_build nor precompile_headers is set") + ", comparing against a unity build")
+        accelerated["unity_build"] = True
+
+    durations = {}
+    for name, entry in (("plain", {"unity_build": False, "precompile_headers": []}), ("accelerated", accelerated)):
+        entry = dict(entry, targets=[target])
+        print(blue_text("Building {} {} {}".format(target, build_type, name)))
+        # the first build configures and brings the dependencies up to date, the rebuild from scratch is measured
+        if not build_entry(entry, build_type) or not build_entry(entry, build_type, ["--clean-first"]):
+            print(red_text("The {} build failed".format(name)))
+            success = False
+            return
+        durations[name] = read_records()[-1]["phases"]["cmake"]
+
+    difference = durations["accelerated"] - durations["plain"]
+    print("\n{:<12} {:>9}".format("build", "duration"))
+    for name, duration in durations.items():
+        print("{:<12} {:>8.1f}s".format(name, duration))
+    verdict = green_text if difference < 0 else red_text
+    print("Acceleration: " + verdict("{:+.1f}s ({:+.0f}%)".format(difference, 100.0 * difference / max(durations["plain"], 0.001))))
+
+
+def report_build_trees():
+    previous = get_last_used_variant()
+    if previous and previous != get_variant_name():
+        print(blue_text("Switching from {} to {}".format(previous, get_variant_name())) + ", each keeps its own build tree")
+    # trees of the layout before per-toolchain directories are never built again
+    build_root = cmake_directory / "build"
+    legacy = [tree for tree in (build_root / "Debug", build_root / "Release", build_root / "multi", build_root)
+        if (tree / "CMakeCache.txt").exists()]
+    if legacy:
+        print(yellow_text("Unused build trees: ") + ', '.join(str(tree) for tree in legacy))
+        print("Builds now go to {}, delete them or run ".format(build_root / get_variant_name()) + green_text("just clean"))
+
+
+def start_watched_build(build_type, languages):
+    command = [sys.executable, str(script_dir / "build.py"), "--config=" + build_type]
+    if len(languages) == 1:
+        command.append("--only=" + next(iter(languages)))
+    print(blue_text("Rebuilding {} {}".format(build_type, " and ".join(sorted(languages)))))
+    return start_process_tree(command, os.getcwd())
 
 
 def clean_build_artifacts():
@@ -59,7 +381,7 @@ def clean_build_artifacts():
         cmake_build_dir = cmake_directory / "build"
         if cmake_build_dir.exists():
             print("CMake:  " + str(cmake_build_dir))
-            shutil.rmtree(cmake_build_dir)
+            move_to_trash(cmake_build_dir)
         disposable_presets = cmake_directory / "CMakeUserPresets.json"
         if disposable_presets.exists():
             print("      " + str(disposable_presets))
@@ -69,54 +391,115 @@ def clean_build_artifacts():
         rust_build_dir = rust_directory / "target"
         if rust_build_dir.exists():
             print("Rust:   " + str(rust_build_dir))
-            shutil.rmtree(rust_build_dir)
+            move_to_trash(rust_build_dir)
 
-    set_last_used_config(None)
+    if configured.exists():
+        # single and multi-config trees alike are gone, so are their configure stamps
+        shutil.rmtree(configured)
+    record_clean()
+    invalidate()
+    start_background_purge()
 
 
 def main():
-    global cmake_directory, rust_directory
-    cmake_directory = get_verified_path("cmake")
-    rust_directory = get_verified_path("rust")
-
+    global success, cmake_directory, rust_directory, force_configure, refresh_deps, partial_build, clean_first
     arguments = argparse.ArgumentParser()
     arguments.add_argument("--clean", action="store_true")
+    arguments.add_argument("--prune", action="store_true", help="evict least recently used build trees over the [clean] budget")
+    arguments.add_argument("--purge-trash", action="store_true", help=argparse.SUPPRESS)
     arguments.add_argument("--config", choices=["Debug", "Release"])
+    arguments.add_argument("--reconfigure", action="store_true", help="configure even if its inputs did not change")
+    arguments.add_argument("--refresh-deps", action="store_true", help="bypass the conan install cache and update dependencies")
+    arguments.add_argument("--only", choices=["cmake", "rust"], help="build a single language")
+    arguments.add_argument("--affected", nargs='?', const="HEAD", metavar="GIT_REF",
+        help="build only targets affected by changes against GIT_REF (default: HEAD)")
+    arguments.add_argument("--matrix", action="store_true", help="build every combination of the [matrix] section")
+    arguments.add_argument("--compare-accel", nargs='?', const="all", metavar="TARGET",
+        help="rebuild TARGET (default: all) with and without unity build and precompiled headers and compare the times")
+    arguments.add_argument("--clean-first", action="store_true", help="rebuild the CMake targets from scratch")
+    arguments.add_argument("--watch", action="store_true", help="rebuild whenever the sources change")
+    arguments.add_argument("--history", type=int, nargs='?', const=20, help="show the last builds and flag slow phases")
+    arguments.add_argument("--report", action="store_true", help="summarize the last ninja build of --config")
+    arguments.add_argument("--jobs", type=int, default=default_budget(), help="how many build steps may run at once")
+    arguments.add_argument("--trace", action="store_true", help="write a Chrome trace of every phase and command to .tools/traces")
     specified_arguments = arguments.parse_args()
 
+    if specified_arguments.trace:
+        enable_tracing()
+    cmake_directory = get_verified_path("cmake")
+    rust_directory = get_verified_path("rust")
+
+    if specified_arguments.only:
+        partial_build = True
+        cmake_directory = cmake_directory if specified_arguments.only == "cmake" else None
+        rust_directory = rust_directory if specified_arguments.only == "rust" else None
+
+    if specified_arguments.purge_trash:
+        purge_trash()
+        return
+
     if specified_arguments.clean:
         clean_build_artifacts()
         return
 
+    if specified_arguments.prune:
+        clean_config = load_config("clean") or {}
+        prune(cmake_directory, rust_directory, int(clean_config.get("budget_gb", 20) * (1 << 30)))
+        return
+
+    if specified_arguments.watch:
+        build_type = specified_arguments.config or get_last_used_config() or "Debug"
+        roots = {language: path for language, path in (("cmake", cmake_directory), ("rust", rust_directory)) if path}
+        watch(roots, lambda languages: start_watched_build(build_type, languages), terminate_process_tree)
+        return
+
+    if specified_arguments.history:
+        history_config = load_config("history") or {}
+        print_history(specified_arguments.history, history_config.get("regression_threshold", 0.25),
+            history_config.get("baseline_window", 10))
+        return
+
+    if specified_arguments.report:
+        build_type = specified_arguments.config or get_last_used_config() or "Release"
+        update_project_config()
+        build_dir = get_build_dir(cmake_directory, build_type) if cmake_directory else None
+        if not build_dir or not report_ninja_build(build_dir, reports_dir, build_type, is_multi_config()):
+            success = False
+        return
+
+    force_configure = specified_arguments.reconfigure
+    refresh_deps = specified_arguments.refresh_deps
+    clean_first = specified_arguments.clean_first
     update_project_config()
+
+    if specified_arguments.matrix:
+        build_matrix(specified_arguments.config, specified_arguments.jobs)
+        return
+    if specified_arguments.compare_accel:
+        compare_acceleration(specified_arguments.config or get_last_used_config() or "Release", specified_arguments.compare_accel)
+        return
     prime_environment(get_compiler())
 
+    if specified_arguments.affected:
+        build_affected(specified_arguments.config or get_last_used_config() or "Release", specified_arguments.affected,
+            specified_arguments.jobs)
+        return
+
+    if cmake_directory:
+        report_build_trees()
+
     if len(sys.argv) == 1:
         # no explicit argument - building the last successful config or fall back to both Release and Debug
         build_type = get_last_used_config()
         if build_type:
             print(blue_text("Rebuilding " + build_type))
-            if cmake_directory:
-                build_cmake(build_type)
-            if rust_directory:
-                build_rust(build_type)
-            if success:
-                set_last_used_config(build_type)
+            if run_build_graph([build_type], False, specified_arguments.jobs):
                 return
         else:
             print("No prior successful build found - " + blue_text("building Release and Debug"))
 
     build_configs = [specified_arguments.config] if specified_arguments.config else ["Release", "Debug"]
-    for build_type in build_configs:
-        if cmake_directory:
-            generate_cmake(build_type)
-            build_cmake(build_type)
-
-        if rust_directory:
-            build_rust(build_type)
-
-        if success:
-            set_last_used_config(build_type)
+    run_build_graph(build_configs, True, specified_arguments.jobs)
 
 
 if __name__ == "__main__":
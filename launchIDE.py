@@ -2,21 +2,24 @@
 
 import argparse
 import subprocess
-import shutil
 import sys
 import os
 
 from bootstrap import check_optional_utils, running_in_native_venv
 from _platform_specific import prime_environment, get_activation_hint
-from _resource_manager import get_compiler, update_project_config
+from _resource_manager import get_compiler, update_project_config, get_verified_path, get_build_dir, get_last_used_config
+from _resource_manager import get_cargo_features
+from _ide_setup import merge_compile_commands, configure_rust_analyzer, start_index_warmup
 from _text_colors import green_text, red_text, yellow_text
 from _paths import main_project, venv_python
+from _toolchain import find_tool
+from _tracing import traced_popen
 
 
 def start_in_background(program):
-    runner = shutil.which("sh")
+    runner = find_tool("sh")
     if runner:
-        subprocess.Popen([str(runner), "-c", program, "."], start_new_session=True, cwd=str(main_project), env=os.environ,
+        traced_popen([str(runner), "-c", program, "."], start_new_session=True, cwd=str(main_project), env=os.environ,
             stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
     else:
         if sys.platform == "win32":
@@ -24,13 +27,27 @@ def start_in_background(program):
             print("Note: git-bash usually comes with it, check for " + green_text("sh.exe") + " in C:\\Program Files\\Git\\usr\\bin\\")
             print("      if that is the case, add it that path to your PATH and restart the terminal")
 
-            subprocess.Popen(["cmd", "/c", program, "."], start_new_session=True, cwd=str(main_project),
+            traced_popen(["cmd", "/c", program, "."], start_new_session=True, cwd=str(main_project),
                 stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         else:
             print(red_text("No sh found in the system") + " make sure your system is not broken")
             sys.exit(1)
 
 
+def prepare_ide(vscode, zed):
+    cmake_directory = get_verified_path("cmake")
+    rust_directory = get_verified_path("rust")
+    if cmake_directory:
+        latest_dir = get_build_dir(cmake_directory, get_last_used_config() or "Release")
+        if merge_compile_commands(cmake_directory, latest_dir):
+            start_index_warmup()
+    if rust_directory:
+        if vscode:
+            configure_rust_analyzer(main_project / ".vscode" / "settings.json", rust_directory, get_cargo_features(rust_directory), False)
+        if zed:
+            configure_rust_analyzer(main_project / ".zed" / "settings.json", rust_directory, get_cargo_features(rust_directory), True)
+
+
 def main():
     check_optional_utils()
     update_project_config()
@@ -41,13 +58,15 @@ def main():
     arguments.add_argument("--zed", action="store_true")
     specified_arguments = arguments.parse_args()
 
+    prepare_ide(specified_arguments.vscode, specified_arguments.zed)
+
     if specified_arguments.vscode:
         print("Starting Visual Studio Code...")
         start_in_background("code")
 
     if specified_arguments.zed:
         print("Starting Zed...")
-        subprocess.Popen(["zed", "."], start_new_session=True, cwd=str(main_project),
+        traced_popen(["zed", "."], start_new_session=True, cwd=str(main_project),
             stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
     if not running_in_native_venv():
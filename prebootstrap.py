@@ -6,20 +6,103 @@ import platform
 from pathlib import Path
 import subprocess
 import shutil
+import hashlib
+import tempfile
+import urllib.error
+import urllib.request
 
-from _paths import main_project, tooling_path
+from _paths import main_project
 from _text_colors import red_text, green_text, blue_text, yellow_text
 
 temp_venv = ".venv-temporary"
+uv_version = "0.9.28"
+download_chunk = 1 << 20
+
+
+def get_user_store():
+    # shared by every checkout of the user, so uv and its cache are downloaded once per machine
+    if os.environ.get("TOOLING_STORE"):
+        return Path(os.environ["TOOLING_STORE"])
+    if sys.platform == "win32":
+        return Path(os.environ.get("LOCALAPPDATA", str(Path.home() / "AppData" / "Local"))) / "tooling"
+    return Path(os.environ.get("XDG_CACHE_HOME", str(Path.home() / ".cache"))) / "tooling"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(str(path), "rb") as source:
+        for chunk in iter(lambda: source.read(download_chunk), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stream_download(url, destination):
+    # resumes a previous partial download when the server honors the Range header
+    partial = Path(str(destination) + ".part")
+    offset = partial.stat().st_size if partial.exists() else 0
+    request = urllib.request.Request(url, headers={"Range": "bytes={}-".format(offset)} if offset else {})
+    try:
+        response = urllib.request.urlopen(request, timeout=60)
+    except urllib.error.HTTPError as error:
+        if error.code != 416 or not offset:
+            raise
+        # the leftover part is already complete or longer than the file, it can only be fetched again from the start
+        partial.unlink()
+        return stream_download(url, destination)
+    with response:
+        resumed = offset and response.status == 206
+        if offset and not resumed:
+            offset = 0
+        with open(str(partial), "ab" if resumed else "wb") as target:
+            for chunk in iter(lambda: response.read(download_chunk), b""):
+                target.write(chunk)
+                offset += len(chunk)
+    partial.replace(destination)
+
+
+def download(url, destination):
+    try:
+        stream_download(url, destination)
+    except Exception as download_error:
+        if not shutil.which("curl"):
+            print(red_text("urllib failed: {}; no curl. Terminating. ".format(download_error)))
+            sys.exit(1)
+        print(yellow_text("urllib failed: {}, ".format(download_error)) + "trying curl...")
+        partial = str(destination) + ".part"
+        res = subprocess.run(["curl", "-fL", "-C", "-", url, "-o", partial])
+        if res.returncode != 0:
+            print(red_text("curl also failed with exit code {}".format(res.returncode)))
+            sys.exit(1)
+        Path(partial).replace(destination)
+
+
+def fetch_verified(url, destination):
+    checksum_file = Path(str(destination) + ".sha256")
+    download(url + ".sha256", checksum_file)
+    expected = checksum_file.read_text().split()[0].lower()
+    checksum_file.unlink()
+
+    resumed = Path(str(destination) + ".part").exists()
+    download(url, destination)
+    actual = file_sha256(destination)
+    if actual != expected and resumed:
+        # the part left behind by an earlier attempt was corrupted, the archive is fetched once more from byte 0
+        destination.unlink()
+        download(url, destination)
+        actual = file_sha256(destination)
+    if actual != expected:
+        destination.unlink()
+        print(red_text("Checksum mismatch for {}".format(destination.name)) + "\n\texpected: {}\n\tactual:   {}".format(expected, actual))
+        sys.exit(1)
 
 
 def prime_uv():
     current_os = sys.platform
-    uv_path = tooling_path / "uv" / ("uv.exe" if current_os == "win32" else "uv")
+    store = get_user_store()
+    uv_home = store / "uv" / uv_version
+    uv_path = uv_home / ("uv.exe" if current_os == "win32" else "uv")
 
     if not uv_path.exists():
-        tooling_path.mkdir(exist_ok=True)
-
         try:
             archive_name = {
                 "win32" : "uv-x86_64-pc-windows-msvc.zip",
@@ -30,38 +113,34 @@ def prime_uv():
         except KeyError:
             print(red_text("Unexpected OS!") + " We support Windows (x64), MacOS (arm or x64), and Linux (x64)")
             sys.exit(1)
-        uv_url = "https://github.com/astral-sh/uv/releases/download/0.9.28/" + archive_name
-        temp_archive = tooling_path / archive_name
-        print("Downloading " + archive_name.split('.')[0] + " for " + platform.machine())
-
+        mirror = os.environ.get("TOOLING_UV_MIRROR", "https://github.com/astral-sh/uv/releases/download")
+        uv_url = "{}/{}/{}".format(mirror.rstrip('/'), uv_version, archive_name)
+        # a part left behind by another uv version must never be resumed
+        downloads = store / "downloads" / uv_version
+        if not downloads.exists():
+            downloads.mkdir(parents=True)
+        temp_archive = downloads / archive_name
+        print("Downloading " + archive_name.split('.')[0] + " for " + platform.machine() + " into " + blue_text(str(store)))
+        fetch_verified(uv_url, temp_archive)
+
+        # unpacked aside and renamed into place, so concurrent setups never see a half-written uv
+        unpack_destination = Path(tempfile.mkdtemp(prefix="uv-", dir=str(downloads)))
+        subprocess.run(["tar", "-xf", str(temp_archive), "-C", str(unpack_destination)], check=True)
+        unpacked = unpack_destination / archive_name.split('.')[0] if current_os != "win32" else unpack_destination
+        if not uv_home.parent.exists():
+            uv_home.parent.mkdir(parents=True)
         try:
-            import urllib.request
-            urllib.request.urlretrieve(uv_url, str(temp_archive))
-        except Exception as download_error:
-            if shutil.which("curl"):
-                print(yellow_text("urllib failed: {}, ".format(download_error)) + "trying curl...")
-                res = subprocess.run(["curl", "-fL", uv_url, "-o", str(temp_archive)])
-                if res.returncode != 0:
-                    print(red_text("curl also failed: {}".format(res.stderr)))
-                    sys.exit(1)
-            else:
-                print(red_text("urllib failed: {}; no curl. Terminating. ".format(download_error)))
-                sys.exit(1)
-
-        unpack_destination = tooling_path
-        if current_os == "win32":
-            unpack_destination = unpack_destination / "uv"
-            unpack_destination.mkdir(exist_ok=True)
-        subprocess.run(["tar", "-xvf", str(temp_archive), "-C", str(unpack_destination)], check=True)
-        if current_os == "linux" or current_os == "darwin":
-            dir_path = str(temp_archive).rsplit('.', 2)[0] # remove .tar.gz
-            dir_path = Path(dir_path).absolute()
-            dir_path.rename(dir_path.parent / "uv")
+            unpacked.rename(uv_home)
+        except OSError:
+            if not uv_path.exists():
+                raise
+        shutil.rmtree(str(unpack_destination), ignore_errors=True)
         print("Successfully downloaded and unpacked uv")
         temp_archive.unlink()
 
-    uv_cache_path = uv_path.resolve().parent / ".cache"
-    uv_cache_path.mkdir(exist_ok=True)
+    uv_cache_path = store / "uv-cache"
+    if not uv_cache_path.exists():
+        uv_cache_path.mkdir(parents=True)
     os.environ["UV_CACHE_DIR"] = str(uv_cache_path)
 
     return uv_path
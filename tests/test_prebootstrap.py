@@ -0,0 +1,136 @@
+import hashlib
+import io
+import os
+import sys
+import tarfile
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import prebootstrap
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    # serves the files of the server, honoring "Range: bytes=<offset>-" like the release mirror does
+    def do_GET(self):
+        payload = self.server.files.get(self.path)
+        if payload is None:
+            self.send_error(404)
+            return
+        requested = self.headers.get("Range")
+        self.server.ranges.append((self.path, requested))
+        offset = int(requested.split('=', 1)[1].rstrip('-')) if requested else 0
+        if offset >= len(payload) and requested:
+            self.send_response(416)
+            self.send_header("Content-Range", "bytes */{}".format(len(payload)))
+            self.end_headers()
+            return
+        self.send_response(206 if requested else 200)
+        self.send_header("Content-Length", str(len(payload) - offset))
+        self.end_headers()
+        self.wfile.write(payload[offset:])
+
+    def log_message(self, *_):
+        pass
+
+
+class DownloadTest(unittest.TestCase):
+    payload = bytes(range(256)) * 4096
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+        self.server.ranges = []
+        self.serve(self.payload)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.destination = Path(self.directory.name) / "uv.tar.gz"
+        self.partial = Path(str(self.destination) + ".part")
+        self.url = "http://127.0.0.1:{}/uv.tar.gz".format(self.server.server_address[1])
+
+    def serve(self, payload, checksum=None):
+        self.server.files = {"/uv.tar.gz": payload,
+            "/uv.tar.gz.sha256": (checksum or hashlib.sha256(payload).hexdigest() + "  uv.tar.gz\n").encode()}
+
+    def archive_ranges(self):
+        return [requested for path, requested in self.server.ranges if path == "/uv.tar.gz"]
+
+    def test_resumes_a_partial_download(self):
+        self.partial.write_bytes(self.payload[:1000])
+        prebootstrap.fetch_verified(self.url, self.destination)
+        self.assertEqual(self.destination.read_bytes(), self.payload)
+        self.assertEqual(self.archive_ranges(), ["bytes=1000-"])
+        self.assertFalse(self.partial.exists())
+
+    def test_restarts_when_the_part_is_already_complete(self):
+        self.partial.write_bytes(self.payload)
+        prebootstrap.fetch_verified(self.url, self.destination)
+        self.assertEqual(self.destination.read_bytes(), self.payload)
+        self.assertEqual(self.archive_ranges(), ["bytes={}-".format(len(self.payload)), None])
+
+    def test_restarts_when_the_part_belongs_to_a_longer_file(self):
+        self.partial.write_bytes(self.payload + b"older release")
+        prebootstrap.fetch_verified(self.url, self.destination)
+        self.assertEqual(self.destination.read_bytes(), self.payload)
+
+    def test_restarts_when_the_resumed_file_is_corrupted(self):
+        self.partial.write_bytes(b"\0" * 1000)
+        prebootstrap.fetch_verified(self.url, self.destination)
+        self.assertEqual(self.destination.read_bytes(), self.payload)
+        self.assertEqual(self.archive_ranges(), ["bytes=1000-", None])
+
+    def test_rejects_a_bad_checksum(self):
+        self.serve(self.payload, "0" * 64)
+        with self.assertRaises(SystemExit):
+            prebootstrap.fetch_verified(self.url, self.destination)
+        self.assertFalse(self.destination.exists())
+
+
+@unittest.skipUnless(sys.platform == "linux", "the served archive is the linux build of uv")
+class PrimeUvTest(unittest.TestCase):
+    def setUp(self):
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+            executable = b"#!/bin/sh\necho uv\n"
+            entry = tarfile.TarInfo("uv-x86_64-unknown-linux-gnu/uv")
+            entry.size = len(executable)
+            entry.mode = 0o755
+            tar.addfile(entry, io.BytesIO(executable))
+        self.payload = archive.getvalue()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+        self.server.ranges = []
+        prefix = "/{}/uv-x86_64-unknown-linux-gnu.tar.gz".format(prebootstrap.uv_version)
+        self.server.files = {prefix: self.payload, prefix + ".sha256": hashlib.sha256(self.payload).hexdigest().encode()}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.store = tempfile.TemporaryDirectory()
+        self.addCleanup(self.store.cleanup)
+        environment = {"TOOLING_STORE": self.store.name, "TOOLING_UV_MIRROR": "http://127.0.0.1:{}".format(self.server.server_address[1])}
+        patched = mock.patch.dict(os.environ, environment)
+        patched.start()
+        self.addCleanup(patched.stop)
+
+    def test_ignores_parts_of_other_versions(self):
+        # an earlier version's download is never resumed into this one
+        stale = Path(self.store.name, "downloads", "0.0.1", "uv-x86_64-unknown-linux-gnu.tar.gz.part")
+        stale.parent.mkdir(parents=True)
+        stale.write_bytes(b"\0" * 100)
+        uv_path = prebootstrap.prime_uv()
+        self.assertEqual(uv_path, Path(self.store.name, "uv", prebootstrap.uv_version, "uv"))
+        self.assertTrue(uv_path.exists())
+        self.assertTrue(stale.exists())
+        self.assertNotIn("bytes=100-", [requested for _, requested in self.server.ranges])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,13 +1,63 @@
 #!/usr/bin/env python3
 
-import subprocess
+import argparse
+import os
+import sys
 from _paths import main_project
-from _resource_manager import get_verified_path
+from _text_colors import blue_text, red_text
+from _test_runner import TestUnit, discover_ctest, discover_cargo, parse_shard, select_shard, run_tests
+from _resource_manager import get_verified_path, update_project_config, check_presence, get_last_used_config
+from _resource_manager import get_build_dir, get_cargo_target, get_cargo_features, load_config, get_cargo_link_arguments
 
 
-def main():
+def collect_units(build_type):
+    units = []
+    cmake_directory = get_verified_path("cmake")
+    if cmake_directory:
+        build_dir = get_build_dir(cmake_directory, build_type)
+        if (build_dir / "CTestTestfile.cmake").exists() and check_presence("ctest", False):
+            units += discover_ctest(build_dir, build_type)
+
+    rust_directory = get_verified_path("rust")
+    if rust_directory and check_presence("cargo", False):
+        units += discover_cargo(rust_directory, build_type, get_cargo_target(rust_directory), get_cargo_features(rust_directory),
+            get_cargo_link_arguments(rust_directory))
+
+    # the project test script stays a single unit, and as nobody knows what it reads it is never cached
     test_script = get_verified_path("test")
-    subprocess.run(["python3", str(test_script)], check=True, cwd=str(main_project))
+    if test_script:
+        units.append(TestUnit("script " + test_script.name, ["python3", str(test_script)], str(main_project), cacheable=False))
+    return units
+
+
+def main():
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument("--config", choices=["Debug", "Release"], help="defaults to the last built config")
+    arguments.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="how many tests may run at once")
+    arguments.add_argument("--shard", help="run only the i-th of N parts of the tests, as i/N")
+    arguments.add_argument("--no-cache", action="store_true", help="rerun tests whose last pass is still valid")
+    arguments.add_argument("--verbose", action="store_true", help="print the output of passing tests too")
+    specified_arguments = arguments.parse_args()
+
+    shard = None
+    if specified_arguments.shard:
+        shard = parse_shard(specified_arguments.shard)
+        if not shard:
+            print(red_text("Invalid shard {}".format(specified_arguments.shard)) + ", expected i/N with 1 <= i <= N")
+            sys.exit(1)
+
+    update_project_config()
+    build_type = specified_arguments.config or get_last_used_config() or "Release"
+    units = collect_units(build_type)
+    if shard:
+        units = select_shard(units, *shard)
+        print("Shard {}/{}: ".format(*shard) + blue_text("{} of the tests".format(len(units))))
+    else:
+        print("Running " + blue_text("{} {} tests".format(len(units), build_type)))
+
+    data = (load_config("test") or {}).get("data", [])
+    passed = run_tests(units, specified_arguments.jobs, specified_arguments.verbose, not specified_arguments.no_cache, data)
+    sys.exit(0 if passed else 1)
 
 
 if __name__ == "__main__":